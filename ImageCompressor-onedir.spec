@@ -0,0 +1,64 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Fast-starting build: pyinstaller ImageCompressor-onedir.spec
+#
+# A onedir bundle starts straight from dist/ImageCompressor/ instead of
+# unpacking Python, Pillow and Tk into a temp directory on every launch
+# like --onefile does. Pillow plugins for formats the app never reads or
+# writes are left out (Image.init() skips plugins that fail to import),
+# and UPX is off because decompressing DLLs at load time costs more
+# startup than the smaller files save.
+import os
+
+import PIL
+
+# Formats the engine handles; MPO is how Pillow opens some camera JPEGs
+# and PPM is loaded by Image.preinit()
+KEEP_PLUGINS = {'Avif', 'Bmp', 'Gif', 'Jpeg', 'Mpo', 'Png', 'Ppm', 'Tiff', 'WebP'}
+unused_plugins = [
+    f"PIL.{name[:-3]}"
+    for name in os.listdir(os.path.dirname(PIL.__file__))
+    if name.endswith('ImagePlugin.py') and name[:-len('ImagePlugin.py')] not in KEEP_PLUGINS
+]
+
+a = Analysis(
+    ['image_compressor.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    # Imported lazily, so the analysis cannot always see them
+    hiddenimports=['imgcompress.engine', 'imgcompress.executors'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=unused_plugins + ['PIL.ImageQt', 'PIL.ImageShow', 'PIL.ImageTk', 'PIL.ImageGrab'],
+    noarchive=False,
+    optimize=1,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='ImageCompressor',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='ImageCompressor',
+)
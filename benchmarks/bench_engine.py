@@ -0,0 +1,189 @@
+"""Throughput benchmark for the compression engine.
+
+Generates (or reuses) the synthetic corpus, then runs the engine once per
+backend and worker count. Each run gets a fresh copy of the corpus and
+its own Python process, so peak RSS is not polluted by earlier runs.
+
+    python -m benchmarks.bench_engine --workers 1,2,4,8 --backends threads,processes \
+        --output results.json [--compare previous.json]
+
+Results are JSON: environment info plus one record per run with
+images/sec, MB/sec, bytes saved, peak RSS and scaling efficiency relative
+to the single-worker run of the same backend.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import DEFAULT_COUNT, DEFAULT_SEED
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_bytes():
+    """Peak RSS of this process and its reaped children, or None"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_one(directory, backend, workers, quality):
+    """Compress directory in this process and return a result record"""
+    from imgcompress import CompressionEngine
+
+    input_bytes = 0
+    for root_dir, _, files in os.walk(directory):
+        input_bytes += sum(os.path.getsize(os.path.join(root_dir, f)) for f in files)
+
+    engine = CompressionEngine(directory, quality=quality, max_workers=workers,
+                               min_file_size=0, backend=backend)
+    start = time.perf_counter()
+    stats = engine.run()
+    elapsed = time.perf_counter() - start
+    return {
+        'backend': backend,
+        'workers': workers,
+        'images': stats['processed_images'],
+        'failed': stats['failed'],
+        'elapsed': elapsed,
+        'images_per_sec': stats['processed_images'] / elapsed if elapsed > 0 else 0,
+        'mb_per_sec': input_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0,
+        'input_bytes': input_bytes,
+        'bytes_saved': stats['total_saved'],
+        'peak_rss': peak_rss_bytes()
+    }
+
+
+def run_isolated(corpus_dir, backend, workers, quality):
+    """Run one configuration on a fresh corpus copy in a child interpreter"""
+    with tempfile.TemporaryDirectory(prefix="imgcompress-bench-") as tmp:
+        work_dir = os.path.join(tmp, "corpus")
+        shutil.copytree(corpus_dir, work_dir)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_engine", "--run-one", work_dir,
+             "--backends", backend, "--workers", str(workers), "--quality", str(quality)],
+            check=True, capture_output=True, text=True, cwd=REPO_ROOT
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def add_scaling_efficiency(records):
+    """Throughput per worker relative to the 1-worker run of each backend"""
+    baselines = {r['backend']: r['images_per_sec'] for r in records if r['workers'] == 1}
+    for record in records:
+        base = baselines.get(record['backend'])
+        if base:
+            record['speedup'] = record['images_per_sec'] / base
+            record['scaling_efficiency'] = record['speedup'] / record['workers']
+
+
+def environment():
+    from PIL import __version__ as pillow_version
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, cwd=REPO_ROOT).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'python': platform.python_version(),
+        'pillow': pillow_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_revision': revision,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def print_table(records, previous=None):
+    old = {}
+    if previous:
+        old = {(r['backend'], r['workers']): r for r in previous['runs']}
+    print(f"{'backend':<10} {'workers':>7} {'img/s':>8} {'MB/s':>8} {'saved MB':>9} "
+          f"{'RSS MB':>8} {'eff':>5} {'vs prev':>8}")
+    for r in records:
+        rss = f"{r['peak_rss'] / (1024 * 1024):.0f}" if r.get('peak_rss') else '-'
+        eff = f"{r['scaling_efficiency']:.2f}" if 'scaling_efficiency' in r else '-'
+        prev = old.get((r['backend'], r['workers']))
+        delta = f"{(r['images_per_sec'] / prev['images_per_sec'] - 1) * 100:+.1f}%" if prev and prev['images_per_sec'] else '-'
+        print(f"{r['backend']:<10} {r['workers']:>7} {r['images_per_sec']:>8.1f} {r['mb_per_sec']:>8.1f} "
+              f"{r['bytes_saved'] / (1024 * 1024):>9.1f} {rss:>8} {eff:>5} {delta:>8}")
+
+
+def parse_list(value, cast=str):
+    return [cast(v) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compression engine.")
+    parser.add_argument("--corpus", help="Existing corpus directory (generated if omitted)")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="Images to generate")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--backends", default="threads,processes", help="Comma-separated backends")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Previous results JSON to compare throughput against")
+    parser.add_argument("--run-one", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        record = run_one(args.run_one, parse_list(args.backends)[0],
+                         parse_list(args.workers, int)[0], args.quality)
+        print(json.dumps(record))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="imgcompress-corpus-") as tmp:
+        corpus_dir = args.corpus
+        if corpus_dir is None:
+            # Generate in a child: Linux carries ru_maxrss across fork+exec,
+            # so a bloated parent would inflate every run's peak RSS
+            corpus_dir = os.path.join(tmp, "corpus")
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.corpus", corpus_dir,
+                 "--count", str(args.count), "--seed", str(args.seed)],
+                check=True, stdout=subprocess.DEVNULL, cwd=REPO_ROOT
+            )
+
+        records = []
+        for backend in parse_list(args.backends):
+            for workers in parse_list(args.workers, int):
+                record = run_isolated(corpus_dir, backend, workers, args.quality)
+                records.append(record)
+                print(f"{backend} x{workers}: {record['images_per_sec']:.1f} images/sec", file=sys.stderr)
+
+    add_scaling_efficiency(records)
+    results = {
+        'environment': environment(),
+        'corpus': {'path': args.corpus, 'count': args.count, 'seed': args.seed},
+        'quality': args.quality,
+        'runs': records
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_table(records, previous)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Startup-time benchmark for the GUI and the command line.
+
+Each target is started as a fresh interpreter (or frozen executable)
+several times; the fastest, median and slowest wall-clock times are
+reported, along with which heavy modules got imported on the way, so a
+stray eager import shows up even when the timing noise hides it.
+
+    python -m benchmarks.bench_startup --repeat 10 --output startup.json [--compare previous.json]
+    python -m benchmarks.bench_startup --gui
+
+--gui builds the GUI window the way ``image_compressor.main`` does from
+a wrapper script (it needs a display) and closes it as soon as it is
+drawn, so the application itself carries no benchmark hooks.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_engine import REPO_ROOT, environment
+
+# Modules the GUI and CLI should not need until a run starts
+HEAVY_MODULES = ('PIL.Image', 'numpy', 'concurrent.futures', 'multiprocessing', 'imgcompress.engine')
+# Opens the window like image_compressor.main() and quits once it is drawn
+GUI_WINDOW_SCRIPT = (
+    "import tkinter as tk; import image_compressor; "
+    "root = tk.Tk(); image_compressor.ImageCompressorGUI(root); root.geometry('720x800'); "
+    "root.after_idle(root.destroy); root.mainloop()"
+)
+
+_REPORT_MODULES = "import json, sys; print(json.dumps([m for m in {modules!r} if m in sys.modules]))"
+
+
+def python_targets():
+    """Name -> (import statement or None, argv) for interpreter-level targets"""
+    return {
+        'gui-import': ("import image_compressor", [sys.executable, "-c", "import image_compressor"]),
+        'cli-help': ("import imgcompress.cli", [sys.executable, "-m", "imgcompress", "--help"]),
+        'package-import': ("import imgcompress", [sys.executable, "-c", "import imgcompress"]),
+        'engine-import': ("import imgcompress.engine", [sys.executable, "-c", "import imgcompress.engine"]),
+    }
+
+
+def time_command(argv, repeat):
+    """Wall-clock seconds of each of repeat runs, after one warm-up run"""
+    times = []
+    for run in range(repeat + 1):
+        start = time.perf_counter()
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL, cwd=REPO_ROOT)
+        if run:  # The first run only warms the OS file cache
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def loaded_heavy_modules(statement):
+    """Which HEAVY_MODULES are imported after running statement"""
+    code = f"{statement}; " + _REPORT_MODULES.format(modules=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True,
+                            text=True, cwd=REPO_ROOT).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(name, argv, repeat, statement=None):
+    times = time_command(argv, repeat)
+    record = {
+        'target': name,
+        'runs': len(times),
+        'min_ms': min(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'max_ms': max(times) * 1000,
+    }
+    if statement:
+        record['heavy_modules'] = loaded_heavy_modules(statement)
+    return record
+
+
+def print_table(records, previous=None):
+    old = {r['target']: r for r in previous['runs']} if previous else {}
+    print(f"{'target':<16} {'min ms':>8} {'median':>8} {'max ms':>8} {'vs prev':>8}  heavy imports")
+    for r in records:
+        prev = old.get(r['target'])
+        delta = f"{(r['median_ms'] / prev['median_ms'] - 1) * 100:+.1f}%" if prev and prev['median_ms'] else '-'
+        heavy = ', '.join(r['heavy_modules']) if r.get('heavy_modules') else '-'
+        print(f"{r['target']:<16} {r['min_ms']:>8.1f} {r['median_ms']:>8.1f} {r['max_ms']:>8.1f} "
+              f"{delta:>8}  {heavy}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GUI and CLI startup time.")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per target")
+    parser.add_argument("--targets", help="Comma-separated subset of: " + ", ".join(python_targets()))
+    parser.add_argument("--gui", action="store_true",
+                        help="Also time opening the GUI window from source (needs a display)")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    targets = python_targets()
+    names = args.targets.split(',') if args.targets else list(targets)
+    unknown = [name for name in names if name not in targets]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    records = []
+    for name in names:
+        statement, command = targets[name]
+        records.append(measure(name, command, args.repeat, statement))
+        print(f"{name}: {records[-1]['median_ms']:.1f} ms", file=sys.stderr)
+    if args.gui:
+        records.append(measure('gui-window', [sys.executable, "-c", GUI_WINDOW_SCRIPT], args.repeat))
+
+    results = {'environment': environment(), 'repeat': args.repeat, 'runs': records}
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_table(records, previous)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
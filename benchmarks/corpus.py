@@ -0,0 +1,94 @@
+"""Deterministic synthetic image corpus for benchmarks.
+
+Images mix smooth gradients (photo-like, compress well) with seeded NumPy
+noise (compresses badly) across every supported format, several modes
+and a spread of sizes. The same seed always produces byte-identical
+files, so results from different versions are comparable.
+
+    python -m benchmarks.corpus OUTPUT_DIR [--count N] [--seed S]
+"""
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+# (extension, Pillow format, modes the format can store)
+FORMATS = [
+    ('.jpg', 'JPEG', ('RGB', 'L')),
+    ('.png', 'PNG', ('RGB', 'RGBA', 'P', 'L')),
+    ('.webp', 'WEBP', ('RGB', 'RGBA')),
+    ('.tiff', 'TIFF', ('RGB', 'RGBA', 'L')),
+    ('.bmp', 'BMP', ('RGB', 'P', 'L')),
+    ('.gif', 'GIF', ('P', 'L')),
+]
+SIZES = [(320, 240), (800, 600), (1280, 960), (1920, 1080), (3000, 2000)]
+DEFAULT_COUNT = 120
+DEFAULT_SEED = 1234
+
+
+def make_pixels(rng, width, height, noise):
+    """RGB uint8 array: gradient plus gaussian noise of the given strength"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = rng.uniform(0, 2 * np.pi, 3)
+    freq = rng.uniform(0.002, 0.02, 3)
+    channels = [
+        127 + 100 * np.sin(x * freq[i] + y * freq[(i + 1) % 3] + phase[i])
+        for i in range(3)
+    ]
+    pixels = np.stack(channels, axis=-1)
+    if noise:
+        pixels += rng.normal(0, noise, pixels.shape).astype(np.float32)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def make_image(rng, mode, size, noise):
+    width, height = size
+    img = Image.fromarray(make_pixels(rng, width, height, noise), 'RGB')
+    if mode == 'RGBA':
+        # Radial alpha so transparency handling is exercised
+        y, x = np.mgrid[0:height, 0:width]
+        dist = np.hypot(x - width / 2, y - height / 2)
+        alpha = np.clip(255 - dist / dist.max() * 255, 0, 255).astype(np.uint8)
+        img.putalpha(Image.fromarray(alpha, 'L'))
+    elif mode == 'P':
+        img = img.quantize(colors=int(rng.integers(16, 256)))
+    elif mode == 'L':
+        img = img.convert('L')
+    return img
+
+
+def generate_corpus(output_dir, count=DEFAULT_COUNT, seed=DEFAULT_SEED):
+    """Write count images under output_dir and return their paths"""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(count):
+        ext, fmt, modes = FORMATS[index % len(FORMATS)]
+        mode = modes[int(rng.integers(len(modes)))]
+        size = SIZES[int(rng.integers(len(SIZES)))]
+        noise = float(rng.choice([0, 4, 12, 30]))
+        img = make_image(rng, mode, size, noise)
+
+        # Spread files over a few nested directories like a real tree
+        subdir = os.path.join(output_dir, f"set{index % 4}", f"batch{index % 3}")
+        os.makedirs(subdir, exist_ok=True)
+        path = os.path.join(subdir, f"img{index:05d}{ext}")
+        save_kwargs = {'quality': 95} if fmt in ('JPEG', 'WEBP') else {}
+        img.save(path, format=fmt, **save_kwargs)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the benchmark image corpus.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+    paths = generate_corpus(args.output_dir, args.count, args.seed)
+    total = sum(os.path.getsize(p) for p in paths)
+    print(f"Wrote {len(paths)} images ({total / (1024 * 1024):.1f} MB) to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
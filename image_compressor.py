@@ -1,15 +1,23 @@
-import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image
+import importlib
+import os
+import sys
 import threading
-from pathlib import Path
 import time
-import queue
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import multiprocessing
 from collections import defaultdict
 
+# Only light modules here; the engine (Pillow, worker pools) is imported
+# in the background once the window is up
+from imgcompress.events import EventChannel
+from imgcompress.executors import BACKENDS
+from imgcompress.journal import default_journal_path
+from imgcompress.manifest import default_manifest_path
+from imgcompress.profiles import DEFAULT_PROFILE, PROFILE_NAMES
+
+UI_TICK_MS = 100  # GUI refresh interval, independent of images/sec
+LOG_MAX_LINES = 1000
+
 class ImageCompressorGUI:
     def __init__(self, root):
         self.root = root
@@ -19,20 +27,28 @@ class ImageCompressorGUI:
         
         # Variables
         self.selected_directory = tk.StringVar()
+        self.output_directory = tk.StringVar()  # Empty = compress in place
         self.compression_quality = tk.IntVar(value=85)
-        self.max_workers = tk.IntVar(value=min(4, multiprocessing.cpu_count()))
+        self.max_workers = tk.IntVar(value=min(4, os.cpu_count() or 1))
         self.min_file_size = tk.IntVar(value=50)  # KB
+        self.max_dimension = tk.IntVar(value=0)  # px, 0 = keep size
+        self.backend = tk.StringVar(value='threads')
+        self.encoder_profile = tk.StringVar(value=DEFAULT_PROFILE)
+        self.use_manifest = tk.BooleanVar(value=False)
+        self.lossless = tk.BooleanVar(value=False)
+        self.auto_format = tk.BooleanVar(value=False)
+        self.use_journal = tk.BooleanVar(value=False)
         self.is_processing = False
-        self.total_images = 0
-        self.processed_images = 0
-        self.update_queue = queue.Queue()
+        self.engine = None
+        self.events = EventChannel(max_log_lines=LOG_MAX_LINES)
+        self.log_lines = 0
         
         # Performance tracking
         self.start_time = None
         self.stats = defaultdict(int)
         
         self.setup_ui()
-        self.start_queue_processor()
+        self.poll_events()
         
     def setup_ui(self):
         # Main frame with scrollable content
@@ -72,6 +88,18 @@ class ImageCompressorGUI:
         ttk.Button(dir_frame, text="Browse", command=self.browse_directory).grid(row=0, column=1)
         row += 1
         
+        # Optional mirror output
+        ttk.Label(main_frame, text="Output Directory (optional, leaves the source untouched):").grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=(0, 5))
+        row += 1
+        
+        output_frame = ttk.Frame(main_frame)
+        output_frame.grid(row=row, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 15))
+        output_frame.columnconfigure(0, weight=1)
+        
+        ttk.Entry(output_frame, textvariable=self.output_directory, width=60).grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
+        ttk.Button(output_frame, text="Browse", command=self.browse_output_directory).grid(row=0, column=1)
+        row += 1
+        
         # Performance Settings Frame
         perf_frame = ttk.LabelFrame(main_frame, text="Performance Settings", padding="10")
         perf_frame.grid(row=row, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 15))
@@ -86,7 +114,7 @@ class ImageCompressorGUI:
         self.worker_scale = ttk.Scale(
             worker_frame, 
             from_=1, 
-            to=multiprocessing.cpu_count(), 
+            to=os.cpu_count() or 1, 
             orient=tk.HORIZONTAL, 
             variable=self.max_workers,
             length=200
@@ -105,10 +133,34 @@ class ImageCompressorGUI:
         ttk.Entry(size_frame, textvariable=self.min_file_size, width=10).grid(row=0, column=0, padx=(0, 5))
         ttk.Label(size_frame, text="(Skip files smaller than this)").grid(row=0, column=1, sticky=tk.W)
         
+        # Executor backend
+        ttk.Label(perf_frame, text="Backend:").grid(row=2, column=0, sticky=tk.W, pady=(5, 5))
+        backend_frame = ttk.Frame(perf_frame)
+        backend_frame.grid(row=2, column=1, sticky=(tk.W, tk.E), pady=(5, 5))
+        
+        ttk.Combobox(
+            backend_frame,
+            textvariable=self.backend,
+            values=BACKENDS,
+            state="readonly",
+            width=10
+        ).grid(row=0, column=0, padx=(0, 5))
+        ttk.Label(backend_frame, text="(Processes scale across all cores)").grid(row=0, column=1, sticky=tk.W)
+        
+        # Encoder effort: fast/balanced trade a few percent of size for speed
+        ttk.Label(backend_frame, text="Encoder:").grid(row=0, column=2, sticky=tk.W, padx=(15, 5))
+        ttk.Combobox(
+            backend_frame,
+            textvariable=self.encoder_profile,
+            values=PROFILE_NAMES,
+            state="readonly",
+            width=10
+        ).grid(row=0, column=3)
+        
         # Compression quality
-        ttk.Label(perf_frame, text="Compression Quality:").grid(row=2, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Label(perf_frame, text="Compression Quality:").grid(row=3, column=0, sticky=tk.W, pady=(5, 0))
         quality_frame = ttk.Frame(perf_frame)
-        quality_frame.grid(row=2, column=1, sticky=(tk.W, tk.E), pady=(5, 0))
+        quality_frame.grid(row=3, column=1, sticky=(tk.W, tk.E), pady=(5, 0))
         quality_frame.columnconfigure(0, weight=1)
         
         self.quality_scale = ttk.Scale(
@@ -125,6 +177,42 @@ class ImageCompressorGUI:
         self.quality_label.grid(row=0, column=1)
         self.quality_scale.configure(command=self.update_quality_label)
         
+        # Optional downscale
+        ttk.Label(perf_frame, text="Max Dimension (px):").grid(row=4, column=0, sticky=tk.W, pady=(5, 0))
+        dimension_frame = ttk.Frame(perf_frame)
+        dimension_frame.grid(row=4, column=1, sticky=(tk.W, tk.E), pady=(5, 0))
+        
+        ttk.Entry(dimension_frame, textvariable=self.max_dimension, width=10).grid(row=0, column=0, padx=(0, 5))
+        ttk.Label(dimension_frame, text="(0 keeps the original size)").grid(row=0, column=1, sticky=tk.W)
+        
+        # Incremental runs
+        ttk.Checkbutton(
+            perf_frame,
+            text="Skip files unchanged since the last run (keeps a manifest in the directory)",
+            variable=self.use_manifest
+        ).grid(row=5, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        
+        # Lossless only
+        ttk.Checkbutton(
+            perf_frame,
+            text="Lossless only (JPEG/PNG, ignores quality and max dimension)",
+            variable=self.lossless
+        ).grid(row=6, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        # Content-aware output format
+        ttk.Checkbutton(
+            perf_frame,
+            text="Pick the smallest format per image (JPEG, WEBP or lossless WEBP; may change extensions)",
+            variable=self.auto_format
+        ).grid(row=7, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        # Checkpointing
+        ttk.Checkbutton(
+            perf_frame,
+            text="Keep a job journal and resume an interrupted run where it stopped",
+            variable=self.use_journal
+        ).grid(row=8, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
         # Statistics Frame
         stats_frame = ttk.LabelFrame(main_frame, text="Statistics", padding="10")
         stats_frame.grid(row=row, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 15))
@@ -211,6 +299,7 @@ class ImageCompressorGUI:
         
     def clear_log(self):
         self.log_text.delete(1.0, tk.END)
+        self.log_lines = 0
         
     def browse_directory(self):
         directory = filedialog.askdirectory(title="Select Directory with Images")
@@ -218,36 +307,55 @@ class ImageCompressorGUI:
             self.selected_directory.set(directory)
             self.log_message(f"Selected directory: {directory}")
             
-    def start_queue_processor(self):
-        """Process GUI updates from background threads"""
+    def browse_output_directory(self):
+        directory = filedialog.askdirectory(title="Select Output Directory")
+        if directory:
+            self.output_directory.set(directory)
+            self.log_message(f"Output directory: {directory}")
+            
+    def poll_events(self):
+        """Apply the latest engine state to the widgets once per tick"""
         try:
-            while True:
-                update_type, data = self.update_queue.get_nowait()
-                
-                if update_type == "log":
-                    self.log_message(data)
-                elif update_type == "progress":
-                    progress, label_text = data
-                    self.progress_var.set(progress)
-                    self.progress_label.config(text=label_text)
-                elif update_type == "stats":
-                    self.update_stats_display(data)
-                    
-        except queue.Empty:
-            pass
+            snapshot = self.events.snapshot()
+            if snapshot is not None:
+                self.apply_snapshot(snapshot)
         finally:
-            self.root.after(100, self.start_queue_processor)  # Check every 100ms
+            self.root.after(UI_TICK_MS, self.poll_events)
             
-    def log_message(self, message):
-        """Add message to log with timestamp"""
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+    def apply_snapshot(self, snapshot):
+        if snapshot['logs'] or snapshot['dropped_logs']:
+            self.append_log(snapshot['logs'], snapshot['dropped_logs'])
+        if snapshot['progress'] is not None:
+            processed, discovered, scan_complete = snapshot['progress']
+            self.progress_var.set((processed / discovered) * 100 if discovered else 0)
+            if scan_complete:
+                text = f"Progress: {processed}/{discovered} images processed"
+            else:
+                text = f"Progress: {processed} processed, {discovered} discovered so far (scanning...)"
+            self.progress_label.config(text=text)
+        if snapshot['stats'] is not None:
+            self.update_stats_display(snapshot['stats'])
+        if snapshot['finished'] is not None:
+            self.compression_finished()
+            
+    def append_log(self, entries, dropped=0):
+        """Insert a batch of (timestamp, message) lines with a single Text insert"""
+        lines = [f"[{time.strftime('%H:%M:%S', time.localtime(ts))}] {message}\n" for ts, message in entries]
+        if dropped:
+            lines.insert(0, f"... {dropped} log lines skipped ...\n")
+        self.log_text.insert(tk.END, "".join(lines))
         self.log_text.see(tk.END)
         
         # Limit log size to prevent memory issues
-        lines = int(self.log_text.index('end-1c').split('.')[0])
-        if lines > 1000:  # Keep only last 1000 lines
-            self.log_text.delete(1.0, f"{lines-1000}.0")
+        self.log_lines += len(lines)
+        if self.log_lines > LOG_MAX_LINES:
+            excess = self.log_lines - LOG_MAX_LINES
+            self.log_text.delete(1.0, f"{excess + 1}.0")
+            self.log_lines = LOG_MAX_LINES
+            
+    def log_message(self, message):
+        """Add message to log with timestamp (shown on the next tick)"""
+        self.events.log(message)
         
     def update_stats_display(self, stats):
         """Update statistics display"""
@@ -263,213 +371,45 @@ class ImageCompressorGUI:
         elapsed = stats.get('processing_time', 0)
         self.stats_labels["time_elapsed"].config(text=f"{elapsed:.1f}s")
         
-    def get_image_files(self, directory):
-        """Get list of image files with filtering"""
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp'}
-        min_size_bytes = self.min_file_size.get() * 1024
-        
-        image_files = []
-        for root_dir, dirs, files in os.walk(directory):
-            for file in files:
-                if Path(file).suffix.lower() in image_extensions:
-                    full_path = os.path.join(root_dir, file)
-                    try:
-                        if os.path.getsize(full_path) >= min_size_bytes:
-                            image_files.append(full_path)
-                    except OSError:
-                        continue  # Skip files that can't be accessed
-        
-        return image_files
-        
-    def compress_single_image(self, image_path, quality):
-        """Compress a single image - optimized version"""
-        try:
-            original_size = os.path.getsize(image_path)
-            
-            # Use context manager and optimize memory usage
-            with Image.open(image_path) as img:
-                # Skip if image is already very small
-                if original_size < 10240:  # 10KB
-                    return {
-                        'path': image_path,
-                        'success': True,
-                        'original_size': original_size,
-                        'new_size': original_size,
-                        'saved_bytes': 0,
-                        'error': None
-                    }
-                
-                # Get original mode and size
-                original_mode = img.mode
-                original_format = img.format
-                
-                # Convert RGBA to RGB if saving as JPEG
-                file_ext = Path(image_path).suffix.lower()
-                if file_ext in ['.jpg', '.jpeg'] and original_mode == 'RGBA':
-                    # Create white background
-                    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                    rgb_img.paste(img, mask=img.split()[-1] if len(img.split()) == 4 else None)
-                    img = rgb_img
-                
-                # Optimize save parameters based on format
-                save_kwargs = {'optimize': True}
-                
-                if file_ext in ['.jpg', '.jpeg']:
-                    save_kwargs.update({
-                        'format': 'JPEG',
-                        'quality': quality,
-                        'progressive': True
-                    })
-                elif file_ext == '.png':
-                    save_kwargs.update({
-                        'format': 'PNG',
-                        'compress_level': 9
-                    })
-                elif file_ext == '.webp':
-                    save_kwargs.update({
-                        'format': 'WEBP',
-                        'quality': quality,
-                        'method': 6
-                    })
-                else:
-                    # Convert unsupported formats to JPEG
-                    new_path = str(Path(image_path).with_suffix('.jpg'))
-                    save_kwargs.update({
-                        'format': 'JPEG',
-                        'quality': quality,
-                        'progressive': True
-                    })
-                    img.save(new_path, **save_kwargs)
-                    if new_path != image_path:
-                        os.remove(image_path)
-                        image_path = new_path
-                
-                # If not converting format, save with current format
-                if file_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                    img.save(image_path, **save_kwargs)
-            
-            new_size = os.path.getsize(image_path)
-            saved_bytes = original_size - new_size
-            
-            return {
-                'path': image_path,
-                'success': True,
-                'original_size': original_size,
-                'new_size': new_size,
-                'saved_bytes': saved_bytes,
-                'error': None
-            }
-            
-        except Exception as e:
-            return {
-                'path': image_path,
-                'success': False,
-                'original_size': 0,
-                'new_size': 0,
-                'saved_bytes': 0,
-                'error': str(e)
-            }
-            
     def compression_worker(self):
-        """Optimized worker thread for image compression"""
+        """Worker thread driving the compression engine"""
         directory = self.selected_directory.get()
-        quality = self.compression_quality.get()
-        max_workers = int(self.max_workers.get())
-        
-        if not directory or not os.path.exists(directory):
-            self.update_queue.put(("log", "Error: Please select a valid directory"))
-            self.compression_finished()
-            return
+        output_root = self.output_directory.get() or None
+        lossless = self.lossless.get()
+        self.stats = {}
+        try:
+            from imgcompress.engine import CompressionEngine  # Usually preloaded by now
+            self.engine = CompressionEngine(
+                directory,
+                quality=self.compression_quality.get(),
+                max_workers=int(self.max_workers.get()),
+                min_file_size=self.min_file_size.get(),
+                max_dimension=None if lossless else self.max_dimension.get() or None,
+                lossless=lossless,
+                format_policy='auto' if self.auto_format.get() and not lossless else 'keep',
+                backend=self.backend.get(),
+                encoder_profile=DEFAULT_PROFILE if lossless else self.encoder_profile.get(),
+                listener=self.events,
+                manifest_path=default_manifest_path(output_root or directory) if self.use_manifest.get() else None,
+                output_root=output_root,
+                journal_path=default_journal_path(output_root or directory) if self.use_journal.get() else None,
+                resume=self.use_journal.get()
+            )
+            if not self.is_processing:
+                return
             
-        # Get all image files
-        self.update_queue.put(("log", "Scanning for images..."))
-        image_files = self.get_image_files(directory)
+            self.start_time = time.time()
+            self.stats = self.engine.run()
+        except Exception as e:
+            self.events.log(f"Error: {e}")
+        finally:
+            # Widgets are only touched from the Tk thread, on its next tick;
+            # always finish so the Start button comes back even after a crash
+            self.events("finished", self.stats)
         
-        if not image_files:
-            self.update_queue.put(("log", "No images found matching criteria"))
-            self.compression_finished()
-            return
-            
-        self.total_images = len(image_files)
-        self.update_queue.put(("log", f"Found {self.total_images} images to process"))
-        self.update_queue.put(("log", f"Using {max_workers} worker threads"))
-        
-        # Initialize statistics
-        self.stats = {
-            'total_images': self.total_images,
-            'processed_images': 0,
-            'successful': 0,
-            'failed': 0,
-            'total_saved': 0,
-            'processing_time': 0
-        }
-        
-        self.start_time = time.time()
-        self.processed_images = 0
-        
-        # Process images using thread pool
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            future_to_path = {
-                executor.submit(self.compress_single_image, img_path, quality): img_path 
-                for img_path in image_files
-            }
-            
-            # Process completed tasks
-            batch_update_counter = 0
-            for future in as_completed(future_to_path):
-                if not self.is_processing:
-                    # Cancel remaining futures
-                    for f in future_to_path:
-                        f.cancel()
-                    break
-                    
-                result = future.result()
-                self.processed_images += 1
-                
-                # Update statistics
-                self.stats['processed_images'] = self.processed_images
-                self.stats['processing_time'] = time.time() - self.start_time
-                
-                if result['success']:
-                    self.stats['successful'] += 1
-                    self.stats['total_saved'] += result['saved_bytes']
-                    
-                    # Log detailed results only for significant savings or errors
-                    if result['saved_bytes'] > 1024:  # > 1KB saved
-                        relative_path = os.path.relpath(result['path'], directory)
-                        saved_percent = (result['saved_bytes'] / result['original_size'] * 100) if result['original_size'] > 0 else 0
-                        if batch_update_counter % 10 == 0:  # Log every 10th file
-                            self.update_queue.put(("log", f"Compressed {relative_path}: {saved_percent:.1f}% smaller"))
-                else:
-                    self.stats['failed'] += 1
-                    relative_path = os.path.relpath(result['path'], directory)
-                    self.update_queue.put(("log", f"Error processing {relative_path}: {result['error']}"))
-                
-                # Update progress (less frequently for better performance)
-                batch_update_counter += 1
-                if batch_update_counter % 5 == 0 or self.processed_images == self.total_images:
-                    progress = (self.processed_images / self.total_images) * 100
-                    progress_text = f"Progress: {self.processed_images}/{self.total_images} images processed"
-                    self.update_queue.put(("progress", (progress, progress_text)))
-                    self.update_queue.put(("stats", self.stats.copy()))
-        
-        # Final summary
-        if self.is_processing:
-            total_time = time.time() - self.start_time
-            self.update_queue.put(("log", f"\nCompression completed in {total_time:.1f} seconds!"))
-            self.update_queue.put(("log", f"Successfully processed: {self.stats['successful']} images"))
-            self.update_queue.put(("log", f"Failed: {self.stats['failed']} images"))
-            
-            if self.stats['total_saved'] > 0:
-                total_saved_mb = self.stats['total_saved'] / (1024 * 1024)
-                avg_speed = self.stats['successful'] / total_time if total_time > 0 else 0
-                self.update_queue.put(("log", f"Total space saved: {total_saved_mb:.2f} MB"))
-                self.update_queue.put(("log", f"Average speed: {avg_speed:.1f} images/second"))
-        else:
-            self.update_queue.put(("log", "\nCompression stopped by user"))
-            
-        self.compression_finished()
+    def preload_engine(self):
+        """Import the engine off the Tk thread so the first start does not wait for it"""
+        threading.Thread(target=importlib.import_module, args=("imgcompress.engine",), daemon=True).start()
         
     def start_compression(self):
         """Start the compression process"""
@@ -481,6 +421,7 @@ class ImageCompressorGUI:
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.progress_var.set(0)
+        self.events.reset()
         
         # Reset statistics
         for label in self.stats_labels.values():
@@ -493,7 +434,9 @@ class ImageCompressorGUI:
     def stop_compression(self):
         """Stop the compression process"""
         self.is_processing = False
-        self.update_queue.put(("log", "Stopping compression..."))
+        if self.engine is not None:
+            self.engine.stop()
+        self.log_message("Stopping compression...")
         
     def compression_finished(self):
         """Called when compression is finished"""
@@ -503,6 +446,11 @@ class ImageCompressorGUI:
         self.progress_label.config(text="Compression finished")
 
 def main():
+    # Required for the process backend in frozen (PyInstaller) builds
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    
     # Set high DPI awareness for Windows
     try:
         from ctypes import windll
@@ -520,6 +468,7 @@ def main():
     # root.geometry(f"+{x}+{y}")
     root.geometry("720x800")
 
+    root.after_idle(app.preload_engine)
     root.mainloop()
 
 if __name__ == "__main__":
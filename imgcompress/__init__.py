@@ -0,0 +1,42 @@
+"""Image compression engine usable without the Tkinter GUI.
+
+The public names are resolved on first access, so importing a light
+submodule such as ``imgcompress.events`` does not load Pillow.
+"""
+import importlib
+
+_EXPORTS = {
+    'BACKENDS': 'executors',
+    'IMAGE_EXTENSIONS': 'scanner',
+    'CompressionEngine': 'engine',
+    'FileEntry': 'scanner',
+    'compress_batch': 'engine',
+    'compress_single_image': 'engine',
+    'get_image_files': 'engine',
+    'iter_image_files': 'engine',
+    'scan_directory': 'scanner',
+}
+
+__all__ = [
+    'BACKENDS',
+    'IMAGE_EXTENSIONS',
+    'CompressionEngine',
+    'FileEntry',
+    'compress_batch',
+    'compress_single_image',
+    'get_image_files',
+    'iter_image_files',
+    'scan_directory',
+]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,10 @@
+import sys
+
+from .cli import main
+
+if __name__ == "__main__":
+    if getattr(sys, 'frozen', False):
+        # Only frozen builds need it; importing multiprocessing costs startup time
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Animated GIFs and multi-page TIFFs, one frame at a time.
+
+Frames are pulled through ``ImageSequence`` and handed to the encoder as
+they are decoded, so only the current frame is ever held decoded. GIFs
+become animated WEBP (or are re-optimized as GIF) with their per-frame
+delays intact; TIFF pages are recompressed individually with a codec
+chosen for each page's content.
+"""
+import io
+
+from PIL import ImageSequence, TiffImagePlugin, features
+
+from .formats import GRAPHIC_MAX_ENTROPY, classify
+
+MULTI_FRAME_FORMATS = ('GIF', 'TIFF')
+
+
+def _skip_sub_blocks(data, pos):
+    while pos < len(data) and data[pos]:
+        pos += data[pos] + 1
+    return pos + 1
+
+
+def gif_frame_durations(data):
+    """Per-frame delays in ms, read from the GIF's graphic control extensions.
+
+    A frame without its own extension keeps the previous delay, as Pillow
+    reports it. Nothing is decoded.
+    """
+    if data[:3] != b'GIF':
+        raise ValueError("Not a GIF file")
+    pos = 13
+    if data[10] & 0x80:  # Global colour table
+        pos += 3 * (2 << (data[10] & 7))
+    durations = []
+    delay = 0
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:  # Extension
+            if data[pos + 1] == 0xF9 and data[pos + 2] >= 4:
+                delay = int.from_bytes(data[pos + 4:pos + 6], 'little') * 10
+            pos = _skip_sub_blocks(data, pos + 2)
+        elif block == 0x2C:  # Image descriptor
+            flags = data[pos + 9]
+            pos += 10
+            if flags & 0x80:  # Local colour table
+                pos += 3 * (2 << (flags & 7))
+            pos = _skip_sub_blocks(data, pos + 1)  # After the LZW code size
+            durations.append(delay)
+        elif block == 0x3B:  # Trailer
+            break
+        else:
+            raise ValueError("Corrupt GIF block structure")
+    return durations
+
+
+def encode_animation(img, path, buffer, quality, target='webp'):
+    """Encode the animated GIF img (opened from path) into buffer.
+
+    Returns the output format name. WEBP output streams frames through
+    the animation encoder; Pillow's GIF writer keeps every frame for its
+    inter-frame optimization, so target='gif' needs more memory.
+    """
+    if target == 'gif':
+        img.save(buffer, format='GIF', save_all=True, optimize=True)
+        return 'GIF'
+
+    with open(path, 'rb') as f:
+        durations = gif_frame_durations(f.read())
+    if len(durations) != img.n_frames:
+        durations = img.info.get('duration', 0)
+    # Every GIF frame fits in 256 colours, so the colour count says nothing,
+    # and dithering makes photographic GIFs look edge-heavy. Low-entropy
+    # (flat) animations compress far better losslessly
+    graphic = classify(img)['entropy'] < GRAPHIC_MAX_ENTROPY
+    save_kwargs = {'format': 'WEBP', 'save_all': True, 'method': 4, 'duration': durations,
+                   'loop': img.info.get('loop', 1)}  # GIFs without a loop count play once
+    if graphic:
+        save_kwargs['lossless'] = True
+    else:
+        save_kwargs['quality'] = quality
+    img.save(buffer, **save_kwargs)
+    return 'WEBP-lossless' if graphic else 'WEBP'
+
+
+def page_save_kwargs(page, quality):
+    """TIFF compression settings for one page"""
+    if page.mode == '1':
+        return {'compression': 'group4'}
+    if page.mode in ('RGB', 'L') and classify(page)['class'] == 'photo':
+        return {'compression': 'jpeg', 'quality': quality}
+    return {'compression': 'tiff_adobe_deflate'}
+
+
+def encode_pages(img, buffer, quality):
+    """Recompress every page of the multi-page TIFF img into buffer.
+
+    Returns the number of pages, or None if Pillow was built without
+    libtiff and cannot write compressed TIFFs.
+    """
+    if not features.check('libtiff'):
+        return None
+    pages = 0
+    with TiffImagePlugin.AppendingTiffWriter(buffer) as tiff:
+        for page in ImageSequence.Iterator(img):
+            page.load()
+            save_kwargs = page_save_kwargs(page, quality)
+            if 'dpi' in page.info:
+                save_kwargs['dpi'] = page.info['dpi']
+            page.save(tiff, format='TIFF', **save_kwargs)
+            tiff.newFrame()
+            pages += 1
+    buffer.seek(0, io.SEEK_END)  # The writer leaves the position at the last IFD
+    return pages
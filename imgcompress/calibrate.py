@@ -0,0 +1,160 @@
+"""Pick encoder settings for a tree by measuring them on a sample.
+
+``calibrate`` decodes a random sample of the tree's images once each and
+encodes them with every encoder setting of the formats they would be
+written in, timing each encode. Per format, the settings that are
+neither slower nor larger than another (the Pareto front) are kept, and
+one of them is chosen: the smallest within a time budget, or the fastest
+whose output is at most a few percent larger than the smallest.
+"""
+import io
+import itertools
+import os
+import random
+import time
+
+from PIL import Image
+
+from .engine import SOURCE_FORMATS
+from .formats import alpha_used, prepare, save_kwargs_for, to_jpeg_mode
+from .options import DEFAULT_MAX_GROWTH, DEFAULT_SAMPLES
+from .profiles import DEFAULT_PROFILE, ENCODER_OPTIONS, PROFILES
+from .scanner import scan_directory
+
+# Settings too slow to be worth timing at scale
+CALIBRATION_LIMITS = {'AVIF': {'speed': (4, 6, 8, 10)}}
+
+
+def option_grid(output_format):
+    """Every combination of encoder options to try for output_format"""
+    choices = dict(ENCODER_OPTIONS[output_format], **CALIBRATION_LIMITS.get(output_format, {}))
+    grid = []
+    for values in itertools.product(*choices.values()):
+        options = dict(zip(choices, values))
+        if output_format == 'PNG' and options['optimize'] and options['compress_level'] != 9:
+            continue  # Pillow's PNG optimize always uses level 9
+        grid.append(options)
+    return grid
+
+
+def option_label(options):
+    return ",".join(f"{name}={int(value) if isinstance(value, bool) else value}"
+                    for name, value in options.items())
+
+
+def sample_files(directory, samples=DEFAULT_SAMPLES, seed=0, min_size=0):
+    """Up to samples image paths from directory, chosen reproducibly"""
+    paths = sorted(entry.path for entry in scan_directory(directory, min_size))
+    if len(paths) <= samples:
+        return paths
+    return sorted(random.Random(seed).sample(paths, samples))
+
+
+def measure(paths, formats=None, quality=85, repeat=1, log=None):
+    """Encode each image with every setting; returns {format: [measurement]}.
+
+    Images are written in their keep-policy format unless formats lists
+    the formats to measure. Each measurement is a dict with options,
+    seconds (the fastest of repeat encodes), bytes, megapixels and
+    images, summed over the sample.
+    """
+    totals = {}
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                img.load()
+                alpha = alpha_used(img)
+                source = SOURCE_FORMATS.get(os.path.splitext(path)[1].lower(), 'JPEG')
+                for output_format in formats or [source]:
+                    if output_format == 'JPEG':
+                        candidate = to_jpeg_mode(img)
+                    elif output_format in ('PNG', source):
+                        candidate = img  # As the engine saves it with the keep policy
+                    else:
+                        candidate = prepare(img, output_format, alpha)
+                    rows = totals.setdefault(output_format, {})
+                    buffer = io.BytesIO()
+                    for options in option_grid(output_format):
+                        save_kwargs = save_kwargs_for(output_format, quality, {output_format: options})
+                        elapsed = None
+                        for _ in range(max(1, repeat)):
+                            buffer.seek(0)
+                            buffer.truncate()
+                            start = time.perf_counter()
+                            candidate.save(buffer, **save_kwargs)
+                            run = time.perf_counter() - start
+                            elapsed = run if elapsed is None else min(elapsed, run)
+                        row = rows.setdefault(option_label(options), {
+                            'options': options, 'seconds': 0.0, 'bytes': 0, 'megapixels': 0.0, 'images': 0
+                        })
+                        row['seconds'] += elapsed
+                        row['bytes'] += buffer.tell()
+                        row['megapixels'] += img.width * img.height / 1e6
+                        row['images'] += 1
+        except (OSError, ValueError) as e:
+            if log is not None:
+                log(f"Skipping {path}: {e}")
+            continue
+        if log is not None:
+            log(f"Measured {path}")
+    return {output_format: list(rows.values()) for output_format, rows in totals.items()}
+
+
+def pareto_front(measurements):
+    """Measurements no other one beats on both time and size, fastest first"""
+    front = []
+    for row in sorted(measurements, key=lambda r: (r['seconds'], r['bytes'])):
+        if not front or row['bytes'] < front[-1]['bytes']:
+            front.append(row)
+    return front
+
+
+def ms_per_megapixel(row):
+    return 1000 * row['seconds'] / row['megapixels'] if row['megapixels'] else 0.0
+
+
+def choose(front, budget=None, max_growth=DEFAULT_MAX_GROWTH):
+    """Pick one setting from a Pareto front.
+
+    With budget (encode ms per megapixel), the smallest setting within it,
+    or the fastest if none is. Otherwise the fastest setting whose output
+    is at most max_growth percent larger than the smallest.
+    """
+    if budget is not None:
+        within = [row for row in front if ms_per_megapixel(row) <= budget]
+        return within[-1] if within else front[0]
+    limit = front[-1]['bytes'] * (1 + max_growth / 100)
+    return next(row for row in front if row['bytes'] <= limit)
+
+
+def calibrate(directory, samples=DEFAULT_SAMPLES, seed=0, quality=85, formats=None, budget=None,
+              max_growth=DEFAULT_MAX_GROWTH, min_size=0, repeat=1, log=None):
+    """Measure encoder settings on a sample of directory and pick a profile.
+
+    Returns a report dict; its "profile" entry maps each measured format
+    to the chosen options, and the report itself can be passed as an
+    encoder profile file.
+    """
+    paths = sample_files(directory, samples, seed, min_size)
+    report = {'directory': os.path.abspath(directory), 'samples': len(paths), 'quality': quality,
+              'budget_ms_per_mp': budget, 'max_growth': max_growth, 'formats': {}, 'profile': {}}
+    for output_format, measurements in measure(paths, formats, quality, repeat, log).items():
+        front = pareto_front(measurements)
+        chosen = choose(front, budget, max_growth)
+        reference = next(row for row in measurements
+                         if row['options'] == PROFILES[DEFAULT_PROFILE][output_format])
+        smallest = front[-1]['bytes']
+        report['formats'][output_format] = {
+            'settings': [{
+                'options': row['options'],
+                'ms_per_mp': round(ms_per_megapixel(row), 2),
+                'bytes': row['bytes'],
+                'size_vs_smallest': round(row['bytes'] / smallest, 4) if smallest else 1.0,
+                'pareto': row in front,
+                'chosen': row is chosen
+            } for row in sorted(measurements, key=lambda r: r['seconds'])],
+            'speedup_vs_max': round(reference['seconds'] / chosen['seconds'], 2) if chosen['seconds'] else None,
+            'size_vs_max': round(chosen['bytes'] / reference['bytes'], 4) if reference['bytes'] else None
+        }
+        report['profile'][output_format] = chosen['options']
+    return report
@@ -0,0 +1,395 @@
+"""Command-line entry point: ``python -m imgcompress DIRECTORY [options]``
+
+``python -m imgcompress worker HOST:PORT`` runs a distributed worker instead,
+and ``python -m imgcompress calibrate DIRECTORY`` measures encoder settings.
+The engine and Pillow are only imported once a command actually runs.
+"""
+import argparse
+import json
+import os
+import secrets
+import subprocess
+import sys
+
+from .executors import BACKENDS
+from .journal import default_journal_path
+from .manifest import default_manifest_path
+from .options import (ANIMATION_TARGETS, DEDUP_MODES, DEFAULT_LEASE_TTL, DEFAULT_MAX_GROWTH, DEFAULT_NEAR_DISTANCE,
+                      DEFAULT_SAMPLES, FORMAT_POLICIES, QUALITY_MODES, TOKEN_ENV)
+from .profiles import DEFAULT_PROFILE, ENCODER_OPTIONS, PROFILE_NAMES
+from .scanner import DEFAULT_SCAN_WORKERS, benchmark_scan
+
+OUTPUT_MODES = ('text', 'jsonl', 'quiet')
+WORKER_EXIT_TIMEOUT = 30  # Seconds local workers get to notice the job is over
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="imgcompress",
+        description="Compress images in a directory tree without the GUI."
+    )
+    parser.add_argument("directory", help="Root directory to scan for images")
+    parser.add_argument("-q", "--quality", type=int, default=85,
+                        help="JPEG/WEBP quality 1-100 (default: 85)")
+    parser.add_argument("--quality-mode", choices=QUALITY_MODES, default='fixed',
+                        help="fixed: use --quality for every image; target-size/ssim/psnr: "
+                             "bisect quality per image (default: fixed)")
+    parser.add_argument("--target-size", type=int, metavar="KB",
+                        help="Largest acceptable output per image for --quality-mode target-size")
+    parser.add_argument("--min-ssim", type=float, default=0.95,
+                        help="SSIM floor for --quality-mode ssim (default: 0.95)")
+    parser.add_argument("--min-psnr", type=float, default=38.0,
+                        help="PSNR floor in dB for --quality-mode psnr (default: 38)")
+    parser.add_argument("--lossless", action="store_true",
+                        help="Only apply pixel-exact optimizations to JPEG and PNG files: metadata "
+                             "stripping, Huffman optimization (jpegtran), palette reduction, zlib "
+                             "strategy trials; other formats are left alone")
+    parser.add_argument("--format-policy", choices=FORMAT_POLICIES, default='keep',
+                        help="keep: stay in the source format (BMP/GIF/TIFF become JPEG); auto: classify "
+                             "each image and keep the smallest of JPEG, WEBP and lossless WEBP")
+    parser.add_argument("--allow-avif", action="store_true",
+                        help="With --format-policy auto, also try AVIF for photographic images")
+    parser.add_argument("--animated-gif", choices=ANIMATION_TARGETS, default='webp',
+                        help="webp: convert animated GIFs to animated WEBP (frames are streamed); "
+                             "gif: re-optimize them as GIF (default: webp)")
+    parser.add_argument("--encoder-profile", default=DEFAULT_PROFILE, metavar="NAME|PATH",
+                        help=f"Encoder effort: {', '.join(PROFILE_NAMES)}, or a JSON file written by "
+                             f"'imgcompress calibrate' (default: {DEFAULT_PROFILE})")
+    parser.add_argument("--max-dimension", type=int, metavar="PX",
+                        help="Downscale images whose longest side exceeds PX; JPEGs are "
+                             "decoded at reduced scale directly")
+    parser.add_argument("-w", "--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Number of workers (default: min(4, CPU count))")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default='threads',
+                        help="Executor backend (default: threads)")
+    parser.add_argument("--min-size", type=int, default=50,
+                        help="Skip files smaller than this many KB (default: 50)")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="Cap the estimated memory of images being processed at once; "
+                             "large images are serialized and small ones packed around them")
+    parser.add_argument("--scan-workers", type=int, default=DEFAULT_SCAN_WORKERS,
+                        help=f"Threads listing directories in parallel (default: {DEFAULT_SCAN_WORKERS})")
+    parser.add_argument("--benchmark-scan", action="store_true",
+                        help="Only scan the tree and report files/sec; nothing is compressed")
+    parser.add_argument("--manifest", metavar="PATH", nargs='?', const='',
+                        help="Skip files unchanged since they were last compressed; "
+                             "state is kept in PATH (default: DIRECTORY/.imgcompress-manifest.sqlite, "
+                             "or OUTPUT_ROOT/... with --output-root)")
+    parser.add_argument("--output-root", metavar="DIR",
+                        help="Leave DIRECTORY untouched and write a mirrored tree to DIR: compressed "
+                             "images plus copies of every other file")
+    parser.add_argument("--link-unchanged", action="store_true",
+                        help="With --output-root, hard-link files that are not compressed instead of "
+                             "copying them (falls back to copying across filesystems)")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, nargs='?', const='copy',
+                        help="Compress byte-identical files once and copy (default) or hard-link the "
+                             "result to the other copies; waits for the scan to finish first")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="Report visually near-identical images using a difference hash; "
+                             "images skipped as small or unchanged are decoded for it too "
+                             "(requires NumPy)")
+    parser.add_argument("--near-distance", type=int, default=DEFAULT_NEAR_DISTANCE,
+                        help=f"Max differing hash bits for --near-duplicates, 0-7 (default: {DEFAULT_NEAR_DISTANCE})")
+    parser.add_argument("--journal", metavar="PATH", nargs='?', const='',
+                        help="Checkpoint finished files in an append-only job journal "
+                             "(default: DIRECTORY/.imgcompress-journal.jsonl, or in OUTPUT_ROOT)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the interrupted job in the journal (implies --journal), "
+                             "skipping files it already finished")
+    parser.add_argument("--listen", metavar="[HOST:]PORT",
+                        help="Coordinate a distributed job: serve leases of files to workers started "
+                             "with 'imgcompress worker HOST:PORT' on hosts sharing the filesystem")
+    parser.add_argument("--local-workers", type=int, default=0, metavar="N",
+                        help="Start N worker processes on this machine (implies --listen on a free "
+                             "local port if --listen is not given)")
+    parser.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL, metavar="SECONDS",
+                        help="Reassign a lease whose worker has not renewed it for this long "
+                             f"(default: {DEFAULT_LEASE_TTL:.0f})")
+    parser.add_argument("--token", help=f"Shared secret workers must present (default: ${TOKEN_ENV}; "
+                                        "required when listening on a non-loopback address; without "
+                                        "one, loopback coordinators accept any local worker)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Write per-file stage timings to PATH (.csv for CSV, otherwise JSON lines) "
+                             "and add p50/p95/p99 per format to the summary")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Run workers under cProfile and write merged stats to PATH "
+                             "(complete with --backend processes)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the peak Python allocation per file with tracemalloc")
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES, default='text',
+                        help="text: log lines, jsonl: one JSON result per file, quiet: errors only")
+    parser.add_argument("--summary", metavar="PATH",
+                        help="Write the final statistics as JSON to PATH ('-' for stdout)")
+    return parser
+
+
+def build_worker_parser():
+    parser = argparse.ArgumentParser(
+        prog="imgcompress worker",
+        description="Process leases from a coordinator started with --listen."
+    )
+    parser.add_argument("address", metavar="HOST:PORT", help="Coordinator address")
+    parser.add_argument("--token", help=f"Shared secret of the coordinator (default: ${TOKEN_ENV})")
+    parser.add_argument("--quiet", action="store_true", help="Only print errors")
+    return parser
+
+
+def worker_main(argv):
+    args = build_worker_parser().parse_args(argv)
+    from .distributed import parse_address, run_worker
+    try:
+        address = parse_address(args.address)
+    except ValueError:
+        print(f"Error: invalid address {args.address!r}", file=sys.stderr)
+        return 2
+    log = None if args.quiet else lambda message: print(message, flush=True)
+    try:
+        processed = run_worker(address, args.token or os.environ.get(TOKEN_ENV), log=log)
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 1
+    if log is not None:
+        log(f"Worker done: {processed} files")
+    return 0
+
+
+def build_calibrate_parser():
+    parser = argparse.ArgumentParser(
+        prog="imgcompress calibrate",
+        description="Time every encoder setting on a sample of the tree and pick a profile."
+    )
+    parser.add_argument("directory", help="Root directory to sample images from")
+    parser.add_argument("-n", "--samples", type=int, default=DEFAULT_SAMPLES,
+                        help=f"Number of images to sample (default: {DEFAULT_SAMPLES})")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed (default: 0)")
+    parser.add_argument("-q", "--quality", type=int, default=85,
+                        help="JPEG/WEBP quality to calibrate at (default: 85)")
+    parser.add_argument("--formats", type=lambda value: value.split(','), metavar="FMT[,FMT...]",
+                        help=f"Output formats to measure, from {', '.join(ENCODER_OPTIONS)} "
+                             "(default: the format each sampled file is written in)")
+    parser.add_argument("--budget", type=float, metavar="MS",
+                        help="Encode time budget in milliseconds per megapixel; picks the smallest "
+                             "setting that fits")
+    parser.add_argument("--max-growth", type=float, default=DEFAULT_MAX_GROWTH, metavar="PCT",
+                        help="Without --budget, pick the fastest setting at most PCT percent larger "
+                             f"than the smallest (default: {DEFAULT_MAX_GROWTH:g})")
+    parser.add_argument("--min-size", type=int, default=50,
+                        help="Skip files smaller than this many KB (default: 50)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Time each encode this many times and keep the fastest (default: 1)")
+    parser.add_argument("-o", "--output", metavar="PATH",
+                        help="Write the report as JSON to PATH, usable as --encoder-profile PATH "
+                             "('-' for stdout)")
+    parser.add_argument("--quiet", action="store_true", help="Do not print the table")
+    return parser
+
+
+def calibrate_main(argv):
+    args = build_calibrate_parser().parse_args(argv)
+    from .calibrate import calibrate, option_label
+    if not 1 <= args.quality <= 100:
+        print("Error: quality must be between 1 and 100", file=sys.stderr)
+        return 2
+    unknown = [name for name in args.formats or () if name not in ENCODER_OPTIONS]
+    if unknown:
+        print(f"Error: unknown format(s) {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.directory):
+        print("Error: Please select a valid directory", file=sys.stderr)
+        return 2
+    
+    report = calibrate(args.directory, args.samples, args.seed, args.quality, args.formats,
+                       args.budget, args.max_growth, args.min_size * 1024, args.repeat)
+    if not args.quiet:
+        print(f"Calibrated on {report['samples']} images at quality {report['quality']}")
+        for output_format, entry in report['formats'].items():
+            print(f"\n{output_format}: {'ms/MP':>9} {'size':>8}")
+            for row in entry['settings']:
+                mark = '>' if row['chosen'] else ('*' if row['pareto'] else ' ')
+                print(f"{mark} {option_label(row['options']):<32} {row['ms_per_mp']:>9.1f} "
+                      f"{(row['size_vs_smallest'] - 1) * 100:>+7.1f}%")
+            print(f"  chosen: {entry['speedup_vs_max']}x the speed of '{DEFAULT_PROFILE}', "
+                  f"{(entry['size_vs_max'] - 1) * 100:+.1f}% size")
+        print("\n* Pareto-optimal, > chosen")
+    if args.output:
+        write_summary(report, args.output)
+    return 0 if report['formats'] else 1
+
+
+def start_local_workers(count, address, token):
+    """Spawn count worker processes connecting to address"""
+    from .distributed import is_loopback
+    host, port = address
+    if not is_loopback(host):
+        host = '127.0.0.1'  # Wildcard listen addresses are reachable locally too
+    env = dict(os.environ)
+    env.pop(TOKEN_ENV, None)
+    if token is not None:
+        env[TOKEN_ENV] = token  # Not on the command line, where ps shows it
+    # Own session so Ctrl+C reaches only the coordinator, which then stops them cleanly
+    return [subprocess.Popen([sys.executable, '-m', 'imgcompress', 'worker', f"{host}:{port}", '--quiet'],
+                             env=env, start_new_session=True)
+            for _ in range(count)]
+
+
+def stop_local_workers(workers):
+    for worker in workers:
+        try:
+            worker.wait(timeout=WORKER_EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+            worker.wait()
+
+
+def make_listener(output_mode):
+    """Return an engine listener that prints events for the output mode"""
+    def listener(event_type, data):
+        if output_mode == 'text' and event_type == "log":
+            print(data, flush=True)
+        elif output_mode == 'jsonl' and event_type == "result":
+            print(json.dumps(data), flush=True)
+        elif event_type == "log" and data.startswith("Error"):
+            print(data, file=sys.stderr, flush=True)
+    return listener
+
+
+def write_summary(stats, path):
+    summary = json.dumps(stats, indent=2)
+    if path == '-':
+        print(summary)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(summary + "\n")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'worker':
+        return worker_main(argv[1:])
+    if argv and argv[0] == 'calibrate':
+        return calibrate_main(argv[1:])
+    args = build_parser().parse_args(argv)
+    if not 1 <= args.quality <= 100:
+        print("Error: quality must be between 1 and 100", file=sys.stderr)
+        return 2
+    if args.quality_mode == 'target-size' and not args.target_size:
+        print("Error: --quality-mode target-size requires --target-size", file=sys.stderr)
+        return 2
+    if args.max_dimension is not None and args.max_dimension < 1:
+        print("Error: --max-dimension must be at least 1", file=sys.stderr)
+        return 2
+    if args.lossless and (args.quality_mode != 'fixed' or args.max_dimension):
+        print("Error: --lossless cannot be combined with --quality-mode or --max-dimension", file=sys.stderr)
+        return 2
+    if args.lossless and args.format_policy != 'keep':
+        print("Error: --lossless cannot be combined with --format-policy", file=sys.stderr)
+        return 2
+    if args.local_workers < 0 or args.lease_ttl <= 0:
+        print("Error: --local-workers must not be negative and --lease-ttl must be positive", file=sys.stderr)
+        return 2
+    
+    if args.benchmark_scan:
+        report = benchmark_scan(args.directory, args.min_size * 1024, max(1, args.scan_workers))
+        if args.output_mode == 'text':
+            print(f"Scanned {report['files']} files ({report['total_bytes'] / (1024 * 1024):.1f} MB) "
+                  f"in {report['elapsed']:.2f}s with {report['scan_workers']} threads: "
+                  f"{report['files_per_sec']:.0f} files/sec")
+        if args.summary:
+            write_summary(report, args.summary)
+        return 0
+    
+    manifest_path = args.manifest
+    if manifest_path == '':
+        manifest_path = default_manifest_path(args.output_root or args.directory)
+    
+    journal_path = args.journal
+    if journal_path == '' or (journal_path is None and args.resume):
+        journal_path = default_journal_path(args.output_root or args.directory)
+    
+    from .distributed import Coordinator, is_loopback, parse_address  # These load Pillow; not needed for --help
+    from .engine import CompressionEngine
+    
+    coordinator = None
+    local_workers = []
+    if args.listen or args.local_workers:
+        try:
+            host, port = parse_address(args.listen or '127.0.0.1:0')
+        except ValueError:
+            print(f"Error: invalid --listen address {args.listen!r}", file=sys.stderr)
+            return 2
+        token = args.token or os.environ.get(TOKEN_ENV)
+        if token is None and not is_loopback(host):
+            print("Error: --listen on a non-loopback address requires --token", file=sys.stderr)
+            return 2
+        if token is None and not args.listen:
+            # Only our own workers will connect, and they get it through
+            # their environment; a --listen address stays open to workers
+            # started by hand
+            token = secrets.token_hex(16)
+        try:
+            coordinator = Coordinator(host, port, args.lease_ttl, token)
+        except OSError as e:
+            print(f"Error: cannot listen on {host}:{port}: {e}", file=sys.stderr)
+            return 2
+    
+    try:
+        engine = CompressionEngine(
+            args.directory,
+            quality=args.quality,
+            max_workers=args.workers,
+            min_file_size=args.min_size,
+            backend=args.backend,
+            listener=make_listener(args.output_mode),
+            manifest_path=manifest_path,
+            scan_workers=args.scan_workers,
+            quality_mode=args.quality_mode,
+            target_size=args.target_size * 1024 if args.target_size else None,
+            min_ssim=args.min_ssim if args.quality_mode == 'ssim' else None,
+            min_psnr=args.min_psnr if args.quality_mode == 'psnr' else None,
+            max_dimension=args.max_dimension,
+            memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+            metrics_path=args.metrics,
+            profile_path=args.profile,
+            trace_memory=args.trace_memory,
+            output_root=args.output_root,
+            link_unchanged=args.link_unchanged,
+            lossless=args.lossless,
+            format_policy=args.format_policy,
+            allow_avif=args.allow_avif,
+            animation=args.animated_gif,
+            journal_path=journal_path,
+            resume=args.resume,
+            dedup=args.dedup,
+            near_duplicates=args.near_duplicates,
+            near_distance=args.near_distance,
+            coordinator=coordinator,
+            encoder_profile=args.encoder_profile
+        )
+    except (ValueError, RuntimeError) as e:
+        if coordinator is not None:
+            coordinator.close()
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    
+    if coordinator is not None:
+        coordinator.start()
+        local_workers = start_local_workers(args.local_workers, coordinator.address, coordinator.token)
+    try:
+        stats = engine.run()
+    except KeyboardInterrupt:
+        engine.stop()
+        stats = engine.stats
+        stats['stopped'] = True
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+            stop_local_workers(local_workers)
+    
+    if args.summary:
+        write_summary(stats, args.summary)
+    
+    if stats.get('error'):
+        return 2
+    return 1 if stats.get('failed') or stats.get('stopped') else 0
@@ -0,0 +1,142 @@
+"""Exact and near-duplicate detection.
+
+Exact duplicates are found without reading most files: only files that
+share a size with another file are hashed, first over a short prefix and
+then, for prefix collisions, over the whole content in streaming chunks.
+Each group of identical files is compressed once and the output reused.
+
+Near duplicates (resized, re-encoded or lightly edited copies) are only
+reported. Each decoded image gets a 64-bit difference hash; hashes are
+bucketed by 8-bit bands, so with a distance limit below 8 every pair
+within the limit shares at least one bucket and only those pairs are
+compared.
+"""
+import hashlib
+
+from PIL import Image
+
+from .manifest import hash_file
+
+from .lazy import optional_import  # Only the near-duplicate report needs NumPy
+from .options import DEFAULT_NEAR_DISTANCE
+
+PREFIX_BYTES = 64 * 1024
+DHASH_SIZE = 8  # 8x8 gradient bits = 64-bit hash
+DHASH_BANDS = 8
+
+
+def hash_prefix(path, size=PREFIX_BYTES):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(size), digest_size=16).hexdigest()
+
+
+def _hash_many(func, entries, workers):
+    """{path: digest} for entries; files that cannot be read are left out"""
+    def safe(entry):
+        try:
+            return func(entry.path)
+        except OSError:
+            return None
+
+    if not entries:
+        return {}
+    from concurrent.futures import ThreadPoolExecutor  # Deferred like the engine's pools
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        digests = pool.map(safe, entries)
+        return {entry.path: digest for entry, digest in zip(entries, digests) if digest is not None}
+
+
+def _collisions(groups):
+    return [entry for group in groups.values() if len(group) > 1 for entry in group]
+
+
+def group_duplicates(entries, workers=4):
+    """Group FileEntry records by identical content.
+
+    Returns a list of groups (lists of entries) in first-seen order;
+    files without a duplicate are single-entry groups.
+    """
+    by_size = {}
+    for entry in entries:
+        by_size.setdefault(entry.size, []).append(entry)
+
+    # Cheap prefix hash first; equal-sized photos usually differ early on
+    candidates = _collisions(by_size)
+    prefixes = _hash_many(hash_prefix, candidates, workers)
+    by_prefix = {}
+    for entry in candidates:
+        if entry.path in prefixes:
+            by_prefix.setdefault((entry.size, prefixes[entry.path]), []).append(entry)
+    full = _hash_many(hash_file, [e for e in _collisions(by_prefix) if e.size > PREFIX_BYTES], workers)
+
+    groups = {}
+    for entry in entries:
+        if entry.path in full:
+            key = (entry.size, full[entry.path])
+        elif entry.path in prefixes and entry.size <= PREFIX_BYTES:
+            key = (entry.size, prefixes[entry.path])  # The prefix is the whole file
+        else:
+            key = entry.path
+        groups.setdefault(key, []).append(entry)
+    return list(groups.values())
+
+
+def dhash(img):
+    """64-bit difference hash of img as a hex string"""
+    np = optional_import('numpy')
+    small = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+def image_dhash(path):
+    """dhash of the image file at path, decoded as small as the format allows"""
+    with Image.open(path) as img:
+        img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))  # JPEG only; a no-op elsewhere
+        return dhash(img)
+
+
+def dhash_files(entries, workers=4):
+    """(path, dhash) pairs for FileEntry records; unreadable images are left out"""
+    def safe(path):
+        try:
+            return image_dhash(path)
+        except Exception:
+            return None
+
+    return list(_hash_many(safe, entries, workers).items())
+
+
+def find_near_duplicates(hashes, max_distance=DEFAULT_NEAR_DISTANCE):
+    """Cluster (path, hex dhash) pairs whose hashes differ in at most max_distance bits.
+
+    Returns a list of path lists with two or more entries each.
+    """
+    if max_distance >= DHASH_BANDS:
+        raise ValueError(f"max_distance must be below {DHASH_BANDS}")
+    values = [int(h, 16) for _, h in hashes]
+    parent = list(range(len(values)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets = {}
+    band_bits = 64 // DHASH_BANDS
+    mask = (1 << band_bits) - 1
+    for index, value in enumerate(values):
+        for band in range(DHASH_BANDS):
+            buckets.setdefault((band, (value >> (band * band_bits)) & mask), []).append(index)
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if find(a) != find(b) and bin(values[a] ^ values[b]).count('1') <= max_distance:
+                    parent[find(a)] = find(b)
+
+    clusters = {}
+    for index in range(len(values)):
+        clusters.setdefault(find(index), []).append(hashes[index][0])
+    return [paths for paths in clusters.values() if len(paths) > 1]
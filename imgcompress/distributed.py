@@ -0,0 +1,412 @@
+"""Coordinator/worker mode for spreading one job over several machines.
+
+The coordinator stands in for the engine's executor: every chunk the
+engine submits becomes a lease that workers pull over a TCP connection
+speaking one JSON object per line. Workers run ``compress_batch`` on the
+tasks, renew the lease while they work and send the results back. A lease
+that is not renewed within its TTL (a worker crashed or lost its network)
+goes back to the front of the queue for another worker. Workers only
+exchange paths, so every host must see the tree under the same path.
+
+    python -m imgcompress DIRECTORY --listen 0.0.0.0:7070 --token SECRET
+    python -m imgcompress worker coordinator-host:7070 --token SECRET
+
+Requests (worker -> coordinator), each answered with one JSON line:
+
+    {"op": "lease", "worker": ID}             -> {"lease": N, "tasks": [...], "ttl": S, "assignment": K}
+                                                 | {"wait": S} | {"done": true}
+    {"op": "renew", "lease": N, "worker": ID}  -> {"ok": bool, "cancel": bool}
+    {"op": "complete", "lease": N, "worker": ID, "results": [...]} -> {"ok": bool}
+
+K counts how often the lease has been handed out; from the second time
+on, workers skip files the previous holder already rewrote in place.
+"""
+import hmac
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+from .engine import cancelled_result, compress_batch, init_worker, place_duplicates
+from .formats import OUTPUT_SUFFIXES
+from .lossless import find_jpegtran
+from .options import DEFAULT_LEASE_TTL
+
+DEFAULT_PORT = 7070
+LEASE_CHUNK_SIZE = 8  # Tasks per lease
+RENEW_INTERVAL = 2.0  # Seconds between renewals; also how fast workers hear of a stop
+IDLE_WAIT = 0.5  # Seconds a worker waits when no lease is available yet
+
+
+def parse_address(value, default_host='127.0.0.1'):
+    """'host:port', ':port' or 'port' -> (host, port)"""
+    host, _, port = value.rpartition(':')
+    return host or default_host, int(port)
+
+
+def is_loopback(host):
+    return host in ('localhost', '::1') or host.startswith('127.')
+
+
+class _Lease:
+    def __init__(self, lease_id, tasks, future):
+        self.id = lease_id
+        self.tasks = tasks
+        self.future = future
+        self.worker = None
+        self.deadline = None
+        self.assignments = 0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        for line in self.rfile:
+            try:
+                reply = coordinator.dispatch(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {'error': f"Bad request: {e}"}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    """Hands out submitted task chunks as leases; an executor as far as the engine is concerned.
+
+    ``submit`` returns a ``concurrent.futures.Future`` that completes when
+    a worker reports the chunk's results, so the engine's scheduling loop
+    is the same as for local pools. ``cancel_event`` (set by the engine on
+    stop) is passed on to workers in renewal replies.
+    """
+
+    chunk_size = LEASE_CHUNK_SIZE
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, lease_ttl=DEFAULT_LEASE_TTL, token=None):
+        self.lease_ttl = lease_ttl
+        self.token = token
+        self.lock = threading.Lock()
+        self.queue = deque()  # Lease ids waiting for a worker
+        self.leases = {}  # Lease id -> _Lease, until its results arrive
+        self.ids = itertools.count(1)
+        self.cancel_event = None
+        self.closed = False
+        self.reassigned = 0
+        self.workers = set()
+        self.server = _Server((host, port), _Handler)
+        self.server.coordinator = self
+        self.address = self.server.server_address[:2]
+        self.threads = []
+
+    def start(self):
+        """Start accepting workers and expiring stale leases in the background"""
+        for target in (self.server.serve_forever, self._reap):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
+
+    # Executor interface used by the engine
+
+    def submit(self, fn, tasks):
+        if fn is not compress_batch:
+            raise ValueError("Coordinator can only run compress_batch")
+        from concurrent.futures import Future  # Not needed until a job runs
+        future = Future()
+        with self.lock:
+            lease = _Lease(next(self.ids), tasks, future)
+            self.leases[lease.id] = lease
+            self.queue.append(lease.id)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.lock:
+            self.closed = True
+            if cancel_futures:
+                for lease_id in self.queue:
+                    lease = self.leases.pop(lease_id)
+                    lease.future.cancel()
+                self.queue.clear()
+            running = [lease.future for lease in self.leases.values()]
+        if wait and running:
+            # Workers see the closed flag or cancel event on their next
+            # renewal; leases of vanished workers are settled by the reaper
+            from concurrent.futures import wait as wait_futures
+            wait_futures(running)
+        self.close()
+
+    def close(self):
+        """Stop listening; connected workers see the connection drop and exit"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    # Lease bookkeeping
+
+    def _reap(self):
+        while self.server is not None:
+            time.sleep(min(1.0, self.lease_ttl / 4))
+            with self.lock:
+                self._expire(time.monotonic())
+
+    def _settle(self, lease):
+        """Report a lease nobody will work on any more as cancelled files"""
+        del self.leases[lease.id]
+        if lease.assignments or lease.future.set_running_or_notify_cancel():
+            lease.future.set_result([cancelled_result(task['path']) for task in lease.tasks])
+
+    def _expire(self, now):
+        stopping = self.closed or (self.cancel_event is not None and self.cancel_event.is_set())
+        if stopping:
+            while self.queue:
+                self._settle(self.leases[self.queue.popleft()])
+        for lease in list(self.leases.values()):
+            if lease.deadline is None or lease.deadline > now or lease.future.done():
+                continue
+            lease.worker = None
+            lease.deadline = None
+            if stopping:
+                self._settle(lease)
+            else:
+                self.queue.appendleft(lease.id)
+                self.reassigned += 1
+
+    def _lease(self, worker):
+        with self.lock:
+            self._expire(time.monotonic())
+            while self.queue:
+                lease = self.leases[self.queue.popleft()]
+                if lease.assignments == 0 and not lease.future.set_running_or_notify_cancel():
+                    del self.leases[lease.id]  # Cancelled while queued
+                    continue
+                lease.assignments += 1
+                lease.worker = worker
+                lease.deadline = time.monotonic() + self.lease_ttl
+                return {'lease': lease.id, 'tasks': lease.tasks, 'ttl': self.lease_ttl,
+                        'assignment': lease.assignments}
+            if self.closed:
+                return {'done': True}
+        return {'wait': IDLE_WAIT}
+
+    def _renew(self, lease_id, worker):
+        cancel = self.cancel_event is not None and self.cancel_event.is_set()
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is None or lease.worker != worker:
+                return {'ok': False, 'cancel': True}  # Expired and handed to someone else
+            lease.deadline = time.monotonic() + self.lease_ttl
+        return {'ok': True, 'cancel': cancel}
+
+    def _complete(self, lease_id, results):
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is None or lease.future.done():
+                return {'ok': False}
+            # First report wins, even from a worker whose lease had expired
+            del self.leases[lease_id]
+            if lease_id in self.queue:
+                self.queue.remove(lease_id)
+        lease.future.set_result(results)
+        return {'ok': True}
+
+    def dispatch(self, request):
+        if self.token is not None and not hmac.compare_digest(str(request.get('token', '')), self.token):
+            return {'error': "Invalid token"}
+        op = request['op']
+        worker = request.get('worker')
+        if op == 'lease':
+            with self.lock:
+                self.workers.add(worker)
+            return self._lease(worker)
+        if op == 'renew':
+            return self._renew(request['lease'], worker)
+        if op == 'complete':
+            return self._complete(request['lease'], request['results'])
+        return {'error': f"Unknown op {op!r}"}
+
+
+class _Connection:
+    """One JSON-lines request/response channel, shared by threads under a lock"""
+
+    def __init__(self, address, token=None, timeout=30.0):
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.file = self.sock.makefile('rwb')
+        self.token = token
+        self.lock = threading.Lock()
+
+    def request(self, message):
+        if self.token is not None:
+            message = dict(message, token=self.token)
+        with self.lock:
+            self.file.write(json.dumps(message).encode('utf-8') + b"\n")
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed the connection")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def _renew_until(conn, lease_id, worker, interval, finished, cancel_event):
+    while not finished.wait(interval):
+        try:
+            reply = conn.request({'op': 'renew', 'lease': lease_id, 'worker': worker})
+        except (OSError, RuntimeError):
+            cancel_event.set()  # Coordinator gone; stop between stages
+            return
+        if reply.get('cancel'):
+            cancel_event.set()
+
+
+def _done_output(path, size, mtime_ns):
+    """(output path, size) if path was already rewritten or converted in place, else None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        converted = [str(Path(path).with_suffix(suffix)) for suffix in OUTPUT_SUFFIXES]
+        output_path = next((p for p in converted if p != path and os.path.exists(p)), None)
+        if output_path is None:
+            return None  # Genuinely missing; let the task report the error
+        return output_path, os.path.getsize(output_path)
+    if st.st_size == size and st.st_mtime_ns == mtime_ns:
+        return None
+    return path, st.st_size
+
+
+def _already_done_result(path, output_path, size):
+    return {
+        'path': output_path,
+        'source_path': path,
+        'success': True,
+        'original_size': size,
+        'new_size': size,
+        'saved_bytes': 0,
+        'action': 'kept',
+        'already_done': True,
+        'error': None
+    }
+
+
+def finished_earlier(task):
+    """Results for a task an earlier holder of its lease already did, else None.
+
+    A lease reassigned after its worker went silent may have been partly
+    processed in place. A source that was rewritten no longer matches its
+    scanned size and mtime, and a converted one is gone with its output
+    next to it; compressing those again would recompress the output or
+    fail. Duplicates the earlier worker did not get to are still given
+    the original's output.
+    """
+    if task.get('dest_path') or 'mtime_ns' not in task:
+        return None  # Mirror mode never touches the source
+    done = _done_output(task['path'], task['size'], task['mtime_ns'])
+    if done is None:
+        return None
+    output_path, size = done
+    results = [_already_done_result(task['path'], output_path, size)]
+    remaining = []
+    for dup in task.get('duplicates', ()):
+        dup_done = _done_output(dup['path'], dup['size'], dup.get('mtime_ns'))
+        if dup_done is None:
+            remaining.append(dup)
+        else:
+            results.append(dict(_already_done_result(dup['path'], *dup_done), duplicate_of=task['path']))
+    if remaining:
+        placed = {'path': output_path, 'source_path': task['path'], 'success': True,
+                  'action': 'compressed', 'new_size': size, 'error': None}
+        results.extend(place_duplicates(placed, dict(task, duplicates=remaining)))
+    return results
+
+
+def _run_tasks(tasks, assignment):
+    """compress_batch over the tasks no earlier holder of the lease finished"""
+    if assignment <= 1:
+        return compress_batch(tasks)  # Nobody else has seen these tasks
+    results = []
+    pending = []
+    for task in tasks:
+        done = finished_earlier(task)
+        if done is None:
+            pending.append(task)
+        else:
+            results.extend(done)
+    return results + compress_batch(pending)
+
+
+def run_worker(address, token=None, worker_id=None, log=None):
+    """Process leases from the coordinator at address until it is done.
+
+    Returns the number of tasks processed. The coordinator closing the
+    connection counts as the end of the job.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    cancel_event = threading.Event()
+    init_worker(cancel_event)  # Tasks run on this thread
+    jpegtran = find_jpegtran()  # The coordinator's path may not exist on this host
+    conn = _Connection(address, token)
+    processed = 0
+    try:
+        while True:
+            try:
+                reply = conn.request({'op': 'lease', 'worker': worker_id})
+            except (OSError, ConnectionError):
+                break
+            if reply.get('done'):
+                break
+            if 'lease' not in reply:
+                time.sleep(reply.get('wait', IDLE_WAIT))
+                continue
+
+            tasks = reply['tasks']
+            for task in tasks:
+                if 'jpegtran' in task:
+                    task['jpegtran'] = jpegtran
+                # Profiles cannot travel as JSON
+                task.pop('profile', None)
+            cancel_event.clear()
+            finished = threading.Event()
+            renewer = threading.Thread(
+                target=_renew_until,
+                args=(conn, reply['lease'], worker_id, min(reply['ttl'] / 3, RENEW_INTERVAL), finished, cancel_event),
+                daemon=True
+            )
+            renewer.start()
+            try:
+                results = _run_tasks(tasks, reply.get('assignment', 1))
+            finally:
+                finished.set()
+                renewer.join()
+            try:
+                conn.request({'op': 'complete', 'lease': reply['lease'], 'worker': worker_id,
+                              'results': results})
+            except (OSError, ConnectionError):
+                break
+            processed += len(tasks)
+            if log is not None:
+                log(f"Worker {worker_id}: finished lease {reply['lease']} ({len(tasks)} files)")
+    finally:
+        conn.close()
+    return processed
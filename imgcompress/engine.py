@@ -0,0 +1,1069 @@
+"""Headless compression engine shared by the GUI and the command line.
+
+Nothing in this package imports tkinter, so it can be used from batch
+jobs and other Python code on machines without a display.
+"""
+import io
+import os
+import shutil
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from PIL import Image
+
+from .animation import MULTI_FRAME_FORMATS, encode_animation, encode_pages
+from .dedup import DHASH_BANDS, dhash, dhash_files, find_near_duplicates, group_duplicates, image_dhash
+from .executors import BACKENDS, IN_FLIGHT_PER_WORKER, create_executor, process_chunk_size, wait_first
+from .formats import OUTPUT_SUFFIXES, encode_best, output_suffix, save_kwargs_for, to_jpeg_mode
+from .journal import DEFAULT_JOURNAL_NAME, JobJournal
+from .lazy import optional_import
+from .lossless import LOSSLESS_EXTENSIONS, find_jpegtran, optimize_jpeg, optimize_png, png_bit_depth
+from .manifest import DEFAULT_MANIFEST_NAME, Manifest, hash_file, settings_key
+from .metrics import MetricsRecorder, ProfileCollector, StageTimer, profile_call
+from .mirror import mirror_destination, mirror_file
+from .options import ANIMATION_TARGETS, DEDUP_MODES, DEFAULT_NEAR_DISTANCE, FORMAT_POLICIES, QUALITY_MODES
+from .profiles import DEFAULT_PROFILE, PROFILES, load_profile
+from .quality import search_quality
+from .scanner import DEFAULT_SCAN_WORKERS, IMAGE_EXTENSIONS, scan_directory
+from .scheduler import MemoryScheduler, estimate_decode_bytes
+
+SOURCE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}  # Kept as-is
+
+_thread_state = threading.local()  # Per-worker-thread encode buffer and cancel event
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker between stages once the engine is stopping"""
+
+
+def init_worker(cancel_event, ignore_sigint=False):
+    """Pool initializer: give the worker the engine's cancel event.
+    
+    Worker processes ignore Ctrl-C; the engine turns it into a stop
+    and the cancel event reaches them between stages.
+    """
+    _thread_state.cancel_event = cancel_event
+    if ignore_sigint:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def check_cancelled():
+    event = getattr(_thread_state, 'cancel_event', None)
+    if event is not None and event.is_set():
+        raise JobCancelled()
+
+
+def cancelled_result(image_path):
+    return {
+        'path': image_path,
+        'source_path': image_path,
+        'success': False,
+        'original_size': 0,
+        'new_size': 0,
+        'saved_bytes': 0,
+        'action': 'cancelled',
+        'error': "Cancelled"
+    }
+
+
+def iter_image_files(directory, min_file_size=0, scan_workers=1):
+    """Yield image paths as they are found (min_file_size in KB)"""
+    for entry in scan_directory(directory, min_file_size * 1024, workers=scan_workers):
+        yield entry.path
+
+
+def get_image_files(directory, min_file_size=0):
+    """Get list of image files with filtering (min_file_size in KB)"""
+    return list(iter_image_files(directory, min_file_size))
+
+
+def get_encode_buffer():
+    """Return this thread's reusable, emptied in-memory encode buffer"""
+    buffer = getattr(_thread_state, 'buffer', None)
+    if buffer is None:
+        buffer = _thread_state.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    return buffer
+
+
+def atomic_write(path, buffer, mode_source=None, timer=None):
+    """Write buffer contents to path via a temp file and os.replace.
+
+    A crash leaves either the old file or the new one, never a truncated
+    mix. mode_source is a file whose permission bits the result inherits;
+    timer, if given, is charged with "write" and "fsync" stages. A
+    symlink at path is followed, so its target is rewritten and the
+    link stays a link.
+    """
+    path = os.path.realpath(path)
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=f'.{name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with buffer.getbuffer() as view:
+                f.write(view)
+            f.flush()
+            if timer is not None:
+                timer.mark('write')
+            os.fsync(f.fileno())
+            if timer is not None:
+                timer.mark('fsync')
+        if mode_source is not None:
+            shutil.copymode(mode_source, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def open_scaled(img, max_dimension):
+    """Shrink img so its longest side is at most max_dimension.
+
+    JPEGs are first decoded directly at 1/2, 1/4 or 1/8 scale through
+    draft mode, which skips most of the IDCT work and memory of a full
+    decode; a reducing resample then brings them to the exact size.
+    Returns the (possibly new) image and whether it was resized.
+    """
+    if max_dimension < 1:
+        raise ValueError(f"max_dimension must be at least 1, got {max_dimension}")
+    width, height = img.size
+    scale = max_dimension / max(width, height)
+    if scale >= 1:
+        return img, False
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if img.format == 'JPEG':
+        img.draft(None, new_size)  # Picks the smallest DCT scale still >= new_size
+    return img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=2.0), True
+
+
+def compress_single_image(task):
+    """Compress a single image described by a picklable task dict"""
+    image_path = task['path']
+    quality = task['quality']
+    timer = StageTimer()
+    try:
+        # The scanner already stat'ed the file; only fall back to a syscall
+        # for tasks built by hand
+        original_size = task.get('size')
+        if original_size is None:
+            original_size = os.path.getsize(image_path)
+
+        result = {
+            'path': image_path,
+            'source_path': image_path,
+            'success': True,
+            'original_size': original_size,
+            'new_size': original_size,
+            'saved_bytes': 0,
+            'action': 'kept',
+            'error': None
+        }
+        
+        # In mirror mode results go under the output root and the source
+        # tree is never modified
+        dest_path = task.get('dest_path')
+        if task.get('lossless'):
+            return compress_lossless(task, result, timer)
+
+        # Use context manager and optimize memory usage
+        with Image.open(image_path) as img:
+            result['format'] = img.format
+            timer.mark('open')
+            
+            # Skip if image is already very small
+            if original_size < 10240:  # 10KB
+                return keep_original(result, task, timer)
+            
+            # Flattening would drop every frame but the first
+            if getattr(img, 'is_animated', False):
+                return compress_frames(img, task, result, timer)
+
+            # Downscale before anything touches the pixels so JPEGs can
+            # use a reduced-resolution decode
+            if task.get('max_dimension'):
+                img, resized = open_scaled(img, task['max_dimension'])
+                if resized:
+                    result['resized_to'] = list(img.size)
+            else:
+                img.load()
+            timer.mark('decode')
+            check_cancelled()
+            if task.get('dhash'):
+                result['dhash'] = dhash(img)
+
+            file_ext = Path(image_path).suffix.lower()
+            if task.get('format_policy') == 'auto':
+                # Classify the content and keep the smallest candidate format
+                buffer = get_encode_buffer()
+                result.update(encode_best(img, task, buffer))
+                timer.mark('encode')
+                output_path = converted_path(image_path, dest_path,
+                                             output_suffix(result['output_format'], file_ext))
+                return write_if_smaller(result, task, timer, buffer, output_path)
+
+            # Convert to a mode JPEG can store if saving as JPEG
+            if file_ext not in ['.png', '.webp']:
+                img = to_jpeg_mode(img)
+            timer.mark('convert')
+
+            # Encoder effort comes from the task's profile; formats
+            # without a suitable encoder are converted to JPEG
+            output_format = SOURCE_FORMATS.get(file_ext, 'JPEG')
+            save_kwargs = save_kwargs_for(output_format, quality, task.get('encoder'))
+
+            # If not converting format, save with current format
+            output_path = dest_path or image_path
+            if file_ext not in SOURCE_FORMATS:
+                output_path = converted_path(image_path, dest_path, '.jpg')
+
+            # Encode into memory first so nothing touches disk unless it pays off
+            buffer = get_encode_buffer()
+            quality_mode = task.get('quality_mode', 'fixed')
+            if quality_mode != 'fixed' and 'quality' in save_kwargs:
+                # Bisect quality per image, encoding candidates in the same buffer
+                quality, metrics = search_quality(
+                    img, save_kwargs, quality_mode, buffer,
+                    target_size=task.get('target_size'),
+                    min_ssim=task.get('min_ssim'),
+                    min_psnr=task.get('min_psnr')
+                )
+                result['quality'] = quality
+                result['quality_metrics'] = metrics
+            else:
+                img.save(buffer, **save_kwargs)
+            timer.mark('encode')
+
+        return write_if_smaller(result, task, timer, buffer, output_path)
+
+    except JobCancelled:
+        return cancelled_result(image_path)
+    except Exception as e:
+        return {
+            'path': image_path,
+            'source_path': image_path,
+            'success': False,
+            'original_size': 0,
+            'new_size': 0,
+            'saved_bytes': 0,
+            'action': 'failed',
+            'error': str(e)
+        }
+
+
+def converted_path(image_path, dest_path, suffix):
+    """Output path for image_path saved with suffix.
+    
+    When the suffix changes, refuse to clobber a different file that
+    already sits next to the source under the new name.
+    """
+    output_path = dest_path or image_path
+    if suffix == Path(image_path).suffix.lower():
+        return output_path
+    sibling = str(Path(image_path).with_suffix(suffix))
+    if os.path.exists(sibling):
+        raise FileExistsError(f"{os.path.basename(sibling)} already exists")
+    return str(Path(output_path).with_suffix(suffix))
+
+
+def place_duplicates(result, task):
+    """Give each byte-identical copy of task's file the outcome of the original.
+    
+    Compressed output is hard-linked (dedup_link) or copied over each
+    duplicate, so the duplicates are never decoded or encoded.
+    """
+    results = []
+    for dup in task['duplicates']:
+        dup_path = dup['path']
+        dest_path = dup.get('dest_path')
+        dup_result = {
+            'path': dup_path,
+            'source_path': dup_path,
+            'success': result['success'],
+            'original_size': dup['size'],
+            'new_size': dup['size'],
+            'saved_bytes': 0,
+            'action': result['action'],
+            'error': result['error'],
+            'duplicate_of': result['source_path']
+        }
+        if 'dhash' in result:
+            dup_result['dhash'] = result['dhash']  # Same bytes
+        if result['success']:
+            try:
+                if result['action'] == 'compressed':
+                    output_path = converted_path(dup_path, dest_path, Path(result['path']).suffix.lower())
+                    mirror_file(result['path'], output_path, task.get('dedup_link'))
+                    if not dest_path and output_path != dup_path:
+                        os.remove(dup_path)
+                    dup_result.update({
+                        'path': output_path,
+                        'new_size': result['new_size'],
+                        'saved_bytes': dup['size'] - result['new_size']
+                    })
+                elif dest_path:
+                    dup_result['mirrored'] = mirror_file(dup_path, dest_path, task.get('link_unchanged'))
+                    dup_result['path'] = dest_path
+                if 'content_hash' in result:
+                    # Same bytes as the original, so only the mtime differs
+                    dup_result['mtime_ns'] = os.stat(dup_path if dest_path else dup_result['path']).st_mtime_ns
+                    dup_result['content_hash'] = result['content_hash']
+            except Exception as e:
+                dup_result.update({'success': False, 'action': 'failed', 'error': str(e)})
+        results.append(dup_result)
+    return results
+
+
+def compress_frames(img, task, result, timer):
+    """Recompress an animated GIF or multi-page TIFF frame by frame"""
+    if img.format not in MULTI_FRAME_FORMATS:
+        # Animated PNG/WEBP: left alone rather than flattened
+        return keep_original(result, task, timer)
+    
+    image_path = task['path']
+    buffer = get_encode_buffer()
+    if img.format == 'GIF':
+        target = task.get('animation', 'webp')
+        result['output_format'] = encode_animation(img, image_path, buffer, task['quality'], target)
+        suffix = '.gif' if target == 'gif' else '.webp'
+    else:
+        if encode_pages(img, buffer, task['quality']) is None:
+            return keep_original(result, task, timer)
+        result['output_format'] = 'TIFF'
+        suffix = Path(image_path).suffix.lower()
+    result['frames'] = img.n_frames
+    timer.mark('encode')
+    output_path = converted_path(image_path, task.get('dest_path'), suffix)
+    return write_if_smaller(result, task, timer, buffer, output_path)
+
+
+def compress_lossless(task, result, timer):
+    """Optimize a JPEG or PNG without changing a single pixel"""
+    image_path = task['path']
+    file_ext = Path(image_path).suffix.lower()
+    if file_ext not in LOSSLESS_EXTENSIONS or result['original_size'] < 10240:
+        return keep_original(result, task, timer)
+    
+    buffer = get_encode_buffer()
+    if file_ext == '.png':
+        with Image.open(image_path) as img:
+            result['format'] = img.format
+            timer.mark('open')
+            if getattr(img, 'is_animated', False) or png_bit_depth(image_path) > 8:
+                # Re-encoding would keep only the first frame of an animated
+                # PNG, and Pillow reads 16-bit samples as 8-bit
+                return keep_original(result, task, timer)
+            img.load()
+            timer.mark('decode')
+            result['palette_reduced'] = optimize_png(img, buffer)
+    else:
+        result['format'] = 'JPEG'
+        # Resolved per call: a worker process has no other place to cache it
+        if not optimize_jpeg(image_path, buffer, task.get('jpegtran')):
+            result['format'] = 'MPO'
+            return keep_original(result, task, timer)
+    timer.mark('encode')
+    return write_if_smaller(result, task, timer, buffer, task.get('dest_path') or image_path)
+
+
+def write_if_smaller(result, task, timer, buffer, output_path):
+    """Atomically write buffer to output_path if it beats the original"""
+    image_path = task['path']
+    dest_path = task.get('dest_path')
+    new_size = buffer.tell()
+    original_size = result['original_size']
+    if new_size >= original_size:
+        return keep_original(result, task, timer)
+    
+    check_cancelled()  # Last chance: nothing has been written yet
+    if dest_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    atomic_write(output_path, buffer, mode_source=image_path, timer=timer)
+    if not dest_path and output_path != image_path:
+        os.remove(image_path)
+    timer.mark('write')
+    result.update({
+        'path': output_path,
+        'new_size': new_size,
+        'saved_bytes': original_size - new_size,
+        'action': 'compressed'
+    })
+    return finish_result(result, task, timer)
+
+
+def keep_original(result, task, timer):
+    """Finish a result whose original bytes are kept (mirrored if needed)"""
+    dest_path = task.get('dest_path')
+    if dest_path:
+        result['mirrored'] = mirror_file(result['source_path'], dest_path, task.get('link_unchanged'))
+        result['path'] = dest_path
+        timer.mark('write')
+    return finish_result(result, task, timer)
+
+
+def mirror_unchanged(task):
+    """Mirror a file that is not compressed at all (non-image or too small)"""
+    timer = StageTimer()
+    result = {
+        'path': task['path'],
+        'source_path': task['path'],
+        'success': True,
+        'original_size': task['size'],
+        'new_size': task['size'],
+        'saved_bytes': 0,
+        'action': 'kept',
+        'copy_only': True,
+        'error': None
+    }
+    try:
+        return keep_original(result, task, timer)
+    except Exception as e:
+        result.update({'success': False, 'action': 'failed', 'error': str(e)})
+        return result
+
+
+def record_output_state(result, path, content_hash=True):
+    """Add the mtime and (unless content_hash is False) content hash of path to a result"""
+    st = os.stat(path)
+    result['mtime_ns'] = st.st_mtime_ns
+    result['content_hash'] = hash_file(path) if content_hash else ''
+
+
+def finish_result(result, task, timer):
+    if task.get('record_output'):
+        # Hash here so manifest bookkeeping runs in parallel on the workers.
+        # Mirror mode tracks the untouched source, in-place the rewritten file.
+        # Copied or linked files were never read by Python; the manifest
+        # compares them against their mirror only if their mtime changes
+        record_output_state(result, result['source_path'] if task.get('dest_path') else result['path'],
+                            content_hash='mirrored' not in result)
+        timer.mark('hash')
+    if task.get('timings'):
+        result['timings'] = timer.timings
+    return result
+
+
+def add_dhash(result):
+    """Give an image result the dhash of its current file, if it can be read"""
+    if Path(result['source_path']).suffix.lower() not in IMAGE_EXTENSIONS:
+        return
+    try:
+        result['dhash'] = image_dhash(result['path'])
+    except Exception:
+        pass
+
+
+def _compress_tasks(tasks):
+    trace_memory = tasks[0].get('trace_memory')
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    results = []
+    for task in tasks:
+        event = getattr(_thread_state, 'cancel_event', None)
+        if event is not None and event.is_set():
+            results.append(cancelled_result(task['path']))
+            continue
+        if trace_memory:
+            tracemalloc.reset_peak()
+        result = mirror_unchanged(task) if task.get('copy_only') else compress_single_image(task)
+        if trace_memory and 'timings' in result:
+            # Python-level allocations only; with threads the peak is shared
+            result['traced_peak'] = tracemalloc.get_traced_memory()[1]
+        if task.get('dhash') and result['success'] and 'dhash' not in result:
+            # Paths that never decoded the image: lossless, small or copied files
+            add_dhash(result)
+        results.append(result)
+        if task.get('duplicates'):
+            results.extend(place_duplicates(result, task))
+    return results
+
+
+def compress_batch(tasks):
+    """Compress a chunk of tasks in one call to amortize process-pool IPC"""
+    if not tasks:
+        return []
+    if tasks[0].get('profile'):
+        results, raw_stats = profile_call(_compress_tasks, tasks)
+        if raw_stats:
+            # Picked off by the engine before the result is reported
+            results[0]['profile_stats'] = raw_stats
+        return results
+    return _compress_tasks(tasks)
+
+
+def is_within(path, directory):
+    """True if path is directory itself or somewhere below it"""
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+
+class CompressionEngine:
+    """Scan a directory and compress every matching image.
+
+    Files are compressed while the tree is still being scanned: a
+    generator walker feeds a bounded number of in-flight chunks, so work
+    starts immediately and memory does not grow with the file count.
+
+    Progress is reported through ``listener(event_type, data)`` with the
+    same event types the GUI queue uses: "log", "progress" (processed,
+    discovered, scan_complete), "stats" and "result".
+    """
+    
+    def __init__(self, directory, quality=85, max_workers=4, min_file_size=50,
+                 backend='threads', listener=None, manifest_path=None,
+                 scan_workers=DEFAULT_SCAN_WORKERS, quality_mode='fixed', target_size=None,
+                 min_ssim=None, min_psnr=None, max_dimension=None, memory_budget=None,
+                 metrics_path=None, profile_path=None, trace_memory=False, output_root=None,
+                 link_unchanged=False, lossless=False, format_policy='keep', allow_avif=False,
+                 animation='webp', journal_path=None, resume=False, dedup=None,
+                 near_duplicates=False, near_distance=DEFAULT_NEAR_DISTANCE, coordinator=None,
+                 encoder_profile=DEFAULT_PROFILE):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        if coordinator is not None and profile_path:
+            raise ValueError("Profiling is not available with distributed workers")
+        self.directory = directory
+        self.max_workers = max(1, int(max_workers))
+        self.min_file_size = min_file_size  # KB
+        self.backend = backend
+        self.coordinator = coordinator  # distributed.Coordinator; replaces the local pool
+        self.listener = listener
+        self.manifest_path = manifest_path
+        self.scan_workers = max(1, int(scan_workers))
+        self.memory_budget = memory_budget  # Bytes of concurrently decoded images, None = unbounded
+        self.metrics_path = metrics_path
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.metrics = None
+        self.profiler = None
+        self.output_root = os.path.abspath(output_root) if output_root else None
+        self.link_unchanged = link_unchanged
+        self.jpegtran = find_jpegtran() if lossless else None
+        self.manifest = None
+        self.journal_path = journal_path
+        self.resume = resume
+        self.journal = None
+        self.cancel_event = None
+        if dedup is not None and dedup not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode {dedup!r}, expected one of {DEDUP_MODES}")
+        if near_duplicates and optional_import('numpy') is None:
+            raise RuntimeError("The near-duplicate report requires NumPy (pip install numpy)")
+        if near_duplicates and not 0 <= near_distance < DHASH_BANDS:
+            raise ValueError(f"near_distance must be between 0 and {DHASH_BANDS - 1}")
+        self.dedup = dedup
+        self.near_duplicates = near_duplicates
+        self.near_distance = near_distance
+        self.dhashes = []
+        self.unhashed = []
+        self.is_running = False
+        self.stop_requested = threading.Event()  # Never cleared, so a stop before run() sticks
+        self.stats = {}
+        
+        # Everything that affects the output bytes; recorded in the manifest
+        self.settings = {'quality': quality}
+        if max_dimension is not None and max_dimension < 1:
+            raise ValueError(f"max_dimension must be at least 1, got {max_dimension}")
+        if max_dimension:
+            self.settings['max_dimension'] = int(max_dimension)
+        if self.output_root:
+            self.settings['output_root'] = self.output_root
+        # Name, calibration file or dict; only recorded when it changes the output
+        encoder = load_profile(encoder_profile)
+        if encoder != PROFILES[DEFAULT_PROFILE]:
+            self.settings['encoder'] = encoder
+        if lossless:
+            if quality_mode != 'fixed' or max_dimension:
+                raise ValueError("Lossless mode cannot be combined with a quality mode or max dimension")
+            if 'encoder' in self.settings:
+                raise ValueError("Lossless mode cannot be combined with an encoder profile")
+            self.settings['lossless'] = True
+        if animation != 'webp':
+            if animation not in ANIMATION_TARGETS:
+                raise ValueError(f"Unknown animation target {animation!r}, expected one of {ANIMATION_TARGETS}")
+            self.settings['animation'] = animation
+        if format_policy != 'keep':
+            if format_policy not in FORMAT_POLICIES:
+                raise ValueError(f"Unknown format policy {format_policy!r}, expected one of {FORMAT_POLICIES}")
+            if lossless:
+                raise ValueError("Lossless mode cannot be combined with a format policy")
+            self.settings.update({'format_policy': format_policy, 'allow_avif': bool(allow_avif)})
+        if quality_mode != 'fixed':
+            if quality_mode not in QUALITY_MODES:
+                raise ValueError(f"Unknown quality mode {quality_mode!r}, expected one of {QUALITY_MODES}")
+            self.settings.update({
+                'quality_mode': quality_mode,
+                'target_size': target_size,  # Bytes
+                'min_ssim': min_ssim,
+                'min_psnr': min_psnr
+            })
+    
+    def emit(self, event_type, data):
+        if self.listener is not None:
+            self.listener(event_type, data)
+    
+    def log(self, message):
+        self.emit("log", message)
+    
+    def stop(self):
+        """Ask the engine to stop; workers abandon files between stages"""
+        self.stop_requested.set()
+        self.is_running = False
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+    
+    def make_task(self, entry, copy_only=False, duplicates=()):
+        """Build the picklable task descriptor for one scanned FileEntry"""
+        task = dict(self.settings, path=entry.path, size=entry.size, mtime_ns=entry.mtime_ns)
+        if duplicates:
+            task['duplicates'] = [self.duplicate_info(dup) for dup in duplicates]
+            task['dedup_link'] = self.dedup == 'link'
+        if self.near_duplicates:
+            task['dhash'] = True
+        if self.jpegtran:
+            task['jpegtran'] = self.jpegtran
+        if self.output_root:
+            task['dest_path'] = mirror_destination(entry.path, self.directory, self.output_root)
+            task['link_unchanged'] = self.link_unchanged
+            if copy_only:
+                task['copy_only'] = True
+        if self.manifest is not None:
+            task['record_output'] = True
+        if self.metrics is not None:
+            task['timings'] = True
+            if self.trace_memory:
+                task['trace_memory'] = True
+        if self.profiler is not None:
+            task['profile'] = True
+        return task
+    
+    def duplicate_info(self, entry):
+        info = {'path': entry.path, 'size': entry.size, 'mtime_ns': entry.mtime_ns}
+        if self.output_root:
+            info['dest_path'] = mirror_destination(entry.path, self.directory, self.output_root)
+        return info
+    
+    def iter_work(self):
+        """Yield (FileEntry, copy_only, duplicates) for everything to dispatch.
+        
+        With dedup, images are held back until the scan is complete and
+        grouped by content; each group is yielded once, its first file
+        carrying the others as duplicates.
+        """
+        if not self.dedup:
+            for entry, copy_only in self.iter_pending_files():
+                yield entry, copy_only, ()
+            return
+        
+        images = []
+        for entry, copy_only in self.iter_pending_files():
+            if copy_only:
+                yield entry, True, ()
+            else:
+                images.append(entry)
+        self.log(f"Checking {len(images)} images for duplicate content...")
+        groups = group_duplicates(images, self.scan_workers)
+        duplicates = len(images) - len(groups)
+        if duplicates:
+            self.log(f"Found {duplicates} duplicate copies; each unique image is compressed once")
+        for group in groups:
+            yield group[0], False, group[1:]
+    
+    def iter_pending_files(self):
+        """Yield (FileEntry, copy_only) for discovered files that still need work.
+        
+        In place only images are returned. When mirroring, every file is
+        returned; those that are not compression candidates are copy_only.
+        """
+        key = settings_key(self.settings)
+        min_size_bytes = self.min_file_size * 1024
+        if self.output_root:
+            entries = scan_directory(self.directory, 0, extensions=None, workers=self.scan_workers)
+        elif self.near_duplicates:
+            entries = scan_directory(self.directory, 0, workers=self.scan_workers)  # Small ones are hashed too
+        else:
+            entries = scan_directory(self.directory, min_size_bytes, workers=self.scan_workers)
+        for entry in entries:
+            if not self.output_root and entry.size < min_size_bytes:
+                self.skip_unhashed(entry)
+                continue
+            if self.journal is not None and self.journal.is_done(entry.path):
+                self.stats['resumed_skipped'] += 1
+                self.skip_unhashed(entry)
+                continue
+            copy_only = False
+            if self.output_root:
+                name = os.path.basename(entry.path)
+                if name.startswith(DEFAULT_MANIFEST_NAME) or name == DEFAULT_JOURNAL_NAME:
+                    continue
+                copy_only = (os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS
+                             or entry.size < min_size_bytes)
+            if self.manifest is not None and self.is_unchanged(entry, key):
+                self.stats['skipped_unchanged'] += 1
+                self.skip_unhashed(entry)
+                continue
+            if not copy_only:
+                self.stats['total_images'] += 1
+            yield entry, copy_only
+    
+    def skip_unhashed(self, entry):
+        """Remember a skipped image for the near-duplicate report to hash"""
+        if self.near_duplicates and os.path.splitext(entry.path)[1].lower() in IMAGE_EXTENSIONS:
+            self.unhashed.append(entry)
+    
+    def is_unchanged(self, entry, key):
+        """True if the manifest says entry is done and its output is still there"""
+        dest = mirror_destination(entry.path, self.directory, self.output_root) if self.output_root else None
+        if not self.manifest.is_current(entry.path, entry.size, entry.mtime_ns, key, copy_path=dest):
+            return False
+        return self.mirror_exists(entry.path)
+    
+    def mirror_exists(self, path):
+        """False if mirroring and the file's output has gone missing"""
+        if not self.output_root:
+            return True
+        dest = mirror_destination(path, self.directory, self.output_root)
+        return os.path.exists(dest) or any(os.path.exists(str(Path(dest).with_suffix(suffix)))
+                                           for suffix in OUTPUT_SUFFIXES)
+    
+    def run(self):
+        """Compress all images and return the final statistics dict"""
+        self.is_running = True
+        self.dhashes = []
+        self.unhashed = []  # Skipped images the near-duplicate report still needs
+        self.stats = {
+            'total_images': 0,
+            'processed_images': 0,
+            'successful': 0,
+            'failed': 0,
+            'total_saved': 0,
+            'processing_time': 0,
+            'skipped_unchanged': 0,
+            'kept_original': 0,
+            'mirrored_files': 0,
+            'cancelled': 0,
+            'resumed_skipped': 0,
+            'deduplicated': 0,
+            'scan_complete': False,
+            'stopped': False,
+            'error': None
+        }
+        
+        if not self.directory or not os.path.isdir(self.directory):
+            self.stats['error'] = "Please select a valid directory"
+        elif self.output_root and is_within(self.output_root, self.directory):
+            self.stats['error'] = "Output directory must not be inside the source directory"
+        if self.stats['error']:
+            self.log(f"Error: {self.stats['error']}")
+            self.is_running = False
+            return self.stats
+        if self.stop_requested.is_set():
+            self.log("Compression stopped before it started")
+            self.stats['stopped'] = True
+            self.is_running = False
+            return self.stats
+        
+        finished = False
+        try:
+            try:
+                self.open_job_state()
+            except (OSError, sqlite3.Error) as e:
+                # The finally block closes whatever did open
+                self.stats['error'] = f"Cannot open job state: {e}"
+                self.log(f"Error: {self.stats['error']}")
+                return self.stats
+            stats = self._run()
+            finished = not stats['stopped']
+            return stats
+        finally:
+            if self.journal is not None:
+                if finished:
+                    self.journal.complete()
+                self.journal.close()
+                self.journal = None
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+            if self.metrics is not None:
+                self.stats['stage_summary'] = self.metrics.summary()
+                if self.trace_memory:
+                    self.stats['traced_peak_summary'] = self.metrics.peak_summary()
+                self.metrics.close()
+                self.log_stage_summary()
+                self.metrics = None
+            if self.profiler is not None:
+                if self.profiler.dump(self.profile_path):
+                    self.log(f"Profile written to {self.profile_path}")
+                self.profiler = None
+            self.is_running = False
+    
+    def open_job_state(self):
+        """Create the output root and open the manifest, metrics, profiler and journal"""
+        if self.output_root:
+            os.makedirs(self.output_root, exist_ok=True)
+        if self.manifest_path:
+            self.manifest = Manifest(self.manifest_path, self.directory)
+        if self.metrics_path or self.trace_memory:
+            self.metrics = MetricsRecorder(self.metrics_path)
+        if self.profile_path:
+            self.profiler = ProfileCollector()
+        if self.journal_path:
+            self.journal = JobJournal(self.journal_path, self.directory, settings_key(self.settings),
+                                      resume=self.resume)
+            if self.journal.resumed:
+                self.log(f"Resuming job: {len(self.journal.completed)} files already done")
+    
+    def _run(self):
+        self.log("Scanning and compressing images...")
+        if self.coordinator is not None:
+            host, port = self.coordinator.address
+            self.log(f"Coordinating workers on {host}:{port}, {self.scan_workers} scan threads")
+        else:
+            self.log(f"Using {self.max_workers} worker {self.backend}, {self.scan_workers} scan threads")
+        if self.settings.get('lossless'):
+            if self.jpegtran:
+                self.log(f"Lossless mode: JPEG Huffman tables optimized with {self.jpegtran}")
+            else:
+                self.log("Lossless mode: jpegtran not found, JPEGs only have metadata stripped")
+        
+        start_time = time.time()
+        batch_update_counter = 0
+        
+        # Tasks are plain dicts so they pickle cleanly across processes;
+        # threads share memory so there is nothing to amortize by chunking
+        chunked = self.backend == 'processes' and self.coordinator is None
+        pending_files = self.iter_work()
+        scheduler = MemoryScheduler(self.memory_budget)
+        max_in_flight = self.max_workers * IN_FLIGHT_PER_WORKER
+        
+        # Workers check the cancel event between stages, so stop() also
+        # cuts short encodes that are already running
+        if self.coordinator is not None:
+            # Remote workers learn about the event when renewing their lease
+            self.cancel_event = threading.Event()
+            self.coordinator.cancel_event = self.cancel_event
+            executor = self.coordinator
+        else:
+            executor, self.cancel_event = create_executor(self.backend, self.max_workers, init_worker)
+        if not self.is_running:
+            self.cancel_event.set()  # stop() came before the event existed
+        with executor:
+            in_flight = {}  # Future -> bytes reserved with the scheduler
+            while self.is_running:
+                # Pull scanned files into the scheduler's lookahead window
+                while not self.stats['scan_complete'] and scheduler.wants_more():
+                    item = next(pending_files, None)
+                    if item is None:
+                        self.stats['scan_complete'] = True
+                        self.log(f"Scan complete: {self.stats['total_images']} images to process")
+                        break
+                    entry, copy_only, duplicates = item
+                    cost = 0 if copy_only else self.estimate_cost(entry)
+                    scheduler.add(self.make_task(entry, copy_only, duplicates), cost)
+                
+                # Start whatever fits both the bounded queue and the memory budget
+                while len(in_flight) < max_in_flight:
+                    if self.coordinator is not None:
+                        chunk_size = self.coordinator.chunk_size
+                    elif chunked:
+                        chunk_size = process_chunk_size(len(scheduler), self.max_workers)
+                    else:
+                        chunk_size = 1
+                    chunk = []
+                    reserved = 0  # A chunk runs serially, so it needs its largest task's cost
+                    while len(chunk) < chunk_size:
+                        item = scheduler.pop_admissible(reserved)
+                        if item is None:
+                            break
+                        reserved = max(reserved, item[0])
+                        chunk.append(item[1])
+                    if not chunk:
+                        break
+                    in_flight[executor.submit(compress_batch, chunk)] = reserved
+                
+                if not in_flight:
+                    break
+                
+                try:
+                    done = wait_first(in_flight)
+                except KeyboardInterrupt:
+                    self.log("Interrupted, stopping...")
+                    self.stop()
+                    break
+                for future in done:
+                    scheduler.release(in_flight.pop(future))
+                    for result in future.result():
+                        self.stats['processing_time'] = time.time() - start_time
+                        self.handle_result(result, batch_update_counter)
+                        
+                        # Update progress (less frequently for better performance)
+                        batch_update_counter += 1
+                        if batch_update_counter % 5 == 0:
+                            self.emit_progress()
+            
+            if not self.is_running:
+                # Drop queued chunks; running ones return at their next stage
+                # boundary. Keep what they finished so the journal has it.
+                executor.shutdown(wait=True, cancel_futures=True)
+                for future in in_flight:
+                    if not future.cancelled():
+                        for result in future.result():
+                            self.handle_result(result, batch_update_counter)
+        pending_files.close()  # Stops scanner threads if we quit early
+        
+        total_time = time.time() - start_time
+        self.stats['processing_time'] = total_time
+        self.stats['peak_reserved_bytes'] = scheduler.peak_in_use
+        if self.coordinator is not None:
+            self.stats['workers'] = len(self.coordinator.workers)
+            self.stats['reassigned_leases'] = self.coordinator.reassigned
+            if self.coordinator.reassigned:
+                self.log(f"Reassigned {self.coordinator.reassigned} expired leases")
+        if self.near_duplicates:
+            # Files nobody decoded this run (too small or already done)
+            self.dhashes.extend(dhash_files(self.unhashed, self.scan_workers))
+            groups = find_near_duplicates(self.dhashes, self.near_distance)
+            self.stats['near_duplicates'] = [[os.path.relpath(path, self.directory) for path in group]
+                                             for group in groups]
+        self.emit_progress()
+        if not self.is_running:
+            self.stats['stopped'] = True
+            self.log("Compression stopped by user")
+            if self.stats['cancelled']:
+                self.log(f"Abandoned {self.stats['cancelled']} files mid-way; originals are untouched")
+        elif self.stats['processed_images'] == 0 and self.stats['mirrored_files'] == 0:
+            if self.stats['skipped_unchanged'] or self.stats['resumed_skipped']:
+                self.log(f"All images are up to date ({self.stats['skipped_unchanged']} unchanged, "
+                         f"{self.stats['resumed_skipped']} done in the resumed job)")
+                self.log_near_duplicates()
+            else:
+                self.log("No images found matching criteria")
+        else:
+            self.log_summary(total_time)
+        
+        return self.stats
+    
+    def record_manifest(self, result):
+        if self.manifest is None or 'content_hash' not in result:
+            return
+        # Mirror mode records the (unchanged) source, in-place the new file
+        path = result['source_path'] if self.output_root else result['path']
+        size = result['original_size'] if self.output_root else result['new_size']
+        self.manifest.record(path, size, result['mtime_ns'], result['content_hash'],
+                             settings_key(self.settings))
+    
+    def record_journal(self, result):
+        if self.journal is None:
+            return
+        if result['path'] != result['source_path'] and not self.output_root:
+            # Converted in place: the new file must not be compressed again either
+            self.journal.record(result['source_path'], result['path'])
+        else:
+            self.journal.record(result['source_path'])
+    
+    def estimate_cost(self, entry):
+        """Bytes to reserve for an image; header reads only happen with a budget"""
+        if self.memory_budget is None:
+            return 0
+        return estimate_decode_bytes(entry.path, self.settings.get('max_dimension'), fallback=entry.size)
+    
+    def emit_progress(self):
+        self.emit("progress", (self.stats['processed_images'], self.stats['total_images'],
+                               self.stats['scan_complete']))
+        self.emit("stats", self.stats.copy())
+    
+    def handle_result(self, result, counter):
+        """Fold one result dict into the running statistics"""
+        raw_stats = result.pop('profile_stats', None)
+        if self.profiler is not None:
+            self.profiler.add(raw_stats)
+        if result['action'] == 'cancelled':
+            self.stats['cancelled'] += 1
+            return
+        if self.metrics is not None:
+            self.metrics.record(result)
+        self.emit("result", result)
+        relative_path = os.path.relpath(result['source_path'], self.directory)
+        if 'dhash' in result:
+            self.dhashes.append((result['source_path'], result['dhash']))
+        if result.get('copy_only'):
+            self.stats['mirrored_files'] += 1
+            if not result['success']:
+                self.stats['failed'] += 1
+                self.log(f"Error mirroring {relative_path}: {result['error']}")
+            else:
+                self.record_manifest(result)
+                self.record_journal(result)
+            return
+        
+        self.stats['processed_images'] += 1
+        if 'duplicate_of' in result:
+            self.stats['deduplicated'] += 1
+        if result['success']:
+            self.stats['successful'] += 1
+            self.stats['total_saved'] += result['saved_bytes']
+            if result['action'] == 'kept':
+                self.stats['kept_original'] += 1
+            if result.get('already_done'):
+                self.log(f"{relative_path} was already done by the previous holder of its lease")
+            self.record_manifest(result)
+            self.record_journal(result)
+            
+            # Log detailed results only for significant savings
+            if result['saved_bytes'] > 1024 and counter % 10 == 0:  # Log every 10th file
+                saved_percent = (result['saved_bytes'] / result['original_size'] * 100) if result['original_size'] > 0 else 0
+                self.log(f"Compressed {relative_path}: {saved_percent:.1f}% smaller")
+        else:
+            self.stats['failed'] += 1
+            self.log(f"Error processing {relative_path}: {result['error']}")
+    
+    def log_stage_summary(self):
+        for fmt, stages in self.stats['stage_summary'].items():
+            total = stages.get('total')
+            if not total:
+                continue
+            slowest = max((s for s in stages if s != 'total'),
+                          key=lambda s: stages[s]['mean'], default=None)
+            self.log(f"{fmt}: {total['count']} files, p50 {total['p50'] * 1000:.1f} ms, "
+                     f"p95 {total['p95'] * 1000:.1f} ms, p99 {total['p99'] * 1000:.1f} ms"
+                     + (f", slowest stage: {slowest}" if slowest else ""))
+        for fmt, peak in self.stats.get('traced_peak_summary', {}).items():
+            self.log(f"{fmt}: traced peak p50 {peak['p50'] / (1024 * 1024):.1f} MB, "
+                     f"p99 {peak['p99'] / (1024 * 1024):.1f} MB")
+    
+    def log_near_duplicates(self):
+        for group in self.stats.get('near_duplicates', []):
+            self.log(f"Near-duplicates: {', '.join(group)}")
+    
+    def log_summary(self, total_time):
+        self.log(f"Compression completed in {total_time:.1f} seconds!")
+        self.log(f"Successfully processed: {self.stats['successful']} images")
+        self.log(f"Failed: {self.stats['failed']} images")
+        if self.memory_budget:
+            peak_mb = self.stats['peak_reserved_bytes'] / (1024 * 1024)
+            self.log(f"Peak reserved decode memory: {peak_mb:.0f} MB of {self.memory_budget / (1024 * 1024):.0f} MB budget")
+        if self.stats['kept_original']:
+            self.log(f"Kept {self.stats['kept_original']} originals that would not get smaller")
+        if self.output_root:
+            self.log(f"Mirrored {self.stats['mirrored_files']} other files to {self.output_root}")
+        if self.stats['skipped_unchanged']:
+            self.log(f"Skipped {self.stats['skipped_unchanged']} files unchanged since the last run")
+        if self.stats['resumed_skipped']:
+            self.log(f"Skipped {self.stats['resumed_skipped']} files finished before the job was interrupted")
+        if self.stats['deduplicated']:
+            self.log(f"Reused output for {self.stats['deduplicated']} duplicate copies")
+        self.log_near_duplicates()
+        
+        if self.stats['total_saved'] > 0:
+            total_saved_mb = self.stats['total_saved'] / (1024 * 1024)
+            avg_speed = self.stats['successful'] / total_time if total_time > 0 else 0
+            self.log(f"Total space saved: {total_saved_mb:.2f} MB")
+            self.log(f"Average speed: {avg_speed:.1f} images/second")
@@ -0,0 +1,75 @@
+"""Coalescing event channel between the engine and a polling UI.
+
+The engine calls listeners from its own thread for every file. A UI that
+turned each call into widget updates would do work proportional to
+images/sec. ``EventChannel`` is a listener that only keeps the latest
+progress and statistics plus a bounded ring buffer of log lines; the UI
+takes a snapshot on a fixed tick, so its cost per tick stays constant.
+"""
+import threading
+import time
+from collections import deque
+
+DEFAULT_LOG_LINES = 1000
+
+
+class EventChannel:
+    """Engine listener that aggregates events until the next snapshot()"""
+
+    def __init__(self, max_log_lines=DEFAULT_LOG_LINES):
+        self.lock = threading.Lock()
+        self.logs = deque(maxlen=max_log_lines)
+        self.dropped_logs = 0
+        self.progress = None
+        self.stats = None
+        self.finished = None
+        self.changed = False
+
+    def __call__(self, event_type, data):
+        with self.lock:
+            if event_type == "log":
+                if len(self.logs) == self.logs.maxlen:
+                    self.dropped_logs += 1
+                self.logs.append((time.time(), data))
+            elif event_type == "progress":
+                self.progress = data
+            elif event_type == "stats":
+                self.stats = data
+            elif event_type == "finished":
+                self.finished = data
+            else:
+                return  # Per-file "result" events are already folded into stats
+            self.changed = True
+
+    def log(self, message):
+        self("log", message)
+
+    def reset(self):
+        """Forget progress and statistics, e.g. before starting another run"""
+        with self.lock:
+            self.progress = None
+            self.stats = None
+
+    def snapshot(self):
+        """Take everything since the last snapshot, or None if nothing changed.
+
+        Returns a dict with "logs" ([(timestamp, message)]), "dropped_logs"
+        (lines that fell out of the ring buffer), and the latest
+        "progress", "stats" and "finished" values. Log lines and "finished"
+        are consumed; progress and stats stay until replaced.
+        """
+        with self.lock:
+            if not self.changed:
+                return None
+            snapshot = {
+                'logs': list(self.logs),
+                'dropped_logs': self.dropped_logs,
+                'progress': self.progress,
+                'stats': self.stats,
+                'finished': self.finished
+            }
+            self.logs.clear()
+            self.dropped_logs = 0
+            self.finished = None
+            self.changed = False
+        return snapshot
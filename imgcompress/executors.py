@@ -0,0 +1,51 @@
+"""Local worker pools for the engine.
+
+``concurrent.futures`` and ``multiprocessing`` are only imported once a
+run starts, so the GUI and ``imgcompress --help`` do not pay for them at
+startup.
+"""
+import threading
+
+# Executor backends. Pillow holds the GIL during PNG optimize and WEBP
+# method=6 encodes, so only processes scale past a handful of workers on
+# big machines.
+BACKENDS = ('threads', 'processes')
+PROCESS_CHUNK_SIZE = 16  # Upper bound on tasks per process-pool submission
+IN_FLIGHT_PER_WORKER = 4  # Bound on queued chunks, keeps memory flat
+
+
+def process_chunk_size(pending, max_workers):
+    """Tasks per process-pool submission for pending queued tasks.
+
+    Small queues are split one task per chunk so every worker gets some;
+    large ones are batched up to PROCESS_CHUNK_SIZE to amortize IPC.
+    """
+    return min(PROCESS_CHUNK_SIZE, max(1, pending // (max_workers * IN_FLIGHT_PER_WORKER)))
+
+
+def create_executor(backend, max_workers, initializer):
+    """Return (executor, cancel_event) for backend.
+
+    Every worker runs initializer(cancel_event, ignore_sigint); process
+    workers get an event shared across processes and ignore Ctrl-C.
+    """
+    if backend == 'processes':
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        mp_context = multiprocessing.get_context()
+        cancel_event = mp_context.Event()
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                       initializer=initializer, initargs=(cancel_event, True))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=max_workers,
+                                      initializer=initializer, initargs=(cancel_event,))
+    return executor, cancel_event
+
+
+def wait_first(futures):
+    """Block until at least one of futures is done and return the done set"""
+    from concurrent.futures import FIRST_COMPLETED, wait
+    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+    return done
@@ -0,0 +1,152 @@
+"""Content-aware choice of the output format.
+
+Each image is classified from a nearest-neighbour thumbnail: how many
+distinct colours it has, whether its alpha channel is actually used, and
+how much luma entropy and edge energy it carries. Flat graphics
+(screenshots, logos, diagrams) only get lossless candidates; photographic
+content gets the lossy ones. Every candidate is encoded in memory and the
+smallest wins.
+"""
+import io
+
+from PIL import Image, ImageFilter, features
+
+from .profiles import encoder_options
+from .quality import search_quality
+
+THUMBNAIL_SIDE = 256
+GRAPHIC_MAX_COLORS = 256
+GRAPHIC_MAX_GREYS = 32  # Any greyscale image has at most 256 levels
+GRAPHIC_MAX_ENTROPY = 5.0  # Bits; photos are usually 6.5-7.8
+GRAPHIC_MIN_EDGES = 0.05  # Fraction of thumbnail pixels on a sharp edge
+EDGE_THRESHOLD = 64
+
+# Output format -> (Pillow format, suffix for new files, suffixes kept as-is)
+OUTPUT_FORMATS = {
+    'JPEG': ('JPEG', '.jpg', ('.jpg', '.jpeg')),
+    'WEBP': ('WEBP', '.webp', ('.webp',)),
+    'WEBP-lossless': ('WEBP', '.webp', ('.webp',)),
+    'AVIF': ('AVIF', '.avif', ('.avif',)),
+}
+OUTPUT_SUFFIXES = ('.jpg', '.webp', '.avif')
+
+
+def avif_available():
+    """True if this Pillow build can write AVIF"""
+    return bool(features.check('avif'))
+
+
+def to_jpeg_mode(img):
+    """Return img in a mode the JPEG encoder accepts, flattening alpha onto white"""
+    if img.mode in ('RGB', 'L', 'CMYK'):
+        return img
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        # Create white background
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(rgba, mask=rgba.getchannel('A'))
+        return rgb_img
+    return img.convert('RGB')
+
+
+def alpha_used(img):
+    """True if img has an alpha channel or transparency that is not fully opaque"""
+    if img.mode in ('RGBA', 'LA', 'PA'):
+        return img.getchannel('A').getextrema()[0] < 255
+    return 'transparency' in img.info
+
+
+def classify(img):
+    """Describe img's content; 'class' is 'graphic' or 'photo'"""
+    scale = THUMBNAIL_SIDE / max(img.size)
+    if scale < 1:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        # Nearest keeps the original colours; averaging would invent new ones
+        thumb = img.resize(size, Image.Resampling.NEAREST)
+    else:
+        thumb = img
+    greyscale = img.mode in ('1', 'L', 'LA', 'I', 'I;16')
+    colors = thumb.convert('RGBA').getcolors(GRAPHIC_MAX_GREYS if greyscale else GRAPHIC_MAX_COLORS)
+    luma = thumb.convert('L')
+    histogram = luma.filter(ImageFilter.FIND_EDGES).histogram()
+    profile = {
+        'colors': len(colors) if colors is not None else None,
+        'alpha': alpha_used(img),
+        'entropy': round(luma.entropy(), 3),
+        'edges': round(sum(histogram[EDGE_THRESHOLD:]) / (luma.width * luma.height), 4)
+    }
+    graphic = colors is not None or (profile['entropy'] < GRAPHIC_MAX_ENTROPY
+                                     and profile['edges'] >= GRAPHIC_MIN_EDGES)
+    profile['class'] = 'graphic' if graphic else 'photo'
+    return profile
+
+
+def candidate_formats(profile, allow_avif=False):
+    """Output formats worth trying for an image with this profile"""
+    if profile['class'] == 'graphic':
+        return ['WEBP-lossless']
+    candidates = [] if profile['alpha'] else ['JPEG']
+    candidates.append('WEBP')
+    if allow_avif and avif_available():
+        candidates.append('AVIF')
+    return candidates
+
+
+def save_kwargs_for(output_format, quality, profile=None):
+    """Pillow save arguments for output_format under an encoder profile"""
+    save_kwargs = dict(encoder_options(profile, output_format))
+    if output_format == 'WEBP-lossless':
+        save_kwargs.update(format='WEBP', lossless=True)
+    elif output_format == 'PNG':
+        save_kwargs['format'] = 'PNG'
+    else:
+        save_kwargs.update(format=output_format, quality=quality)
+    return save_kwargs
+
+
+def prepare(img, output_format, alpha):
+    """img in a mode the output format can store"""
+    if output_format == 'JPEG':
+        return to_jpeg_mode(img)
+    target = 'RGBA' if alpha else 'RGB'
+    return img if img.mode == target else img.convert(target)
+
+
+def output_suffix(output_format, source_suffix):
+    """Suffix for the output file; the source's is kept if it already fits"""
+    _, new_suffix, kept = OUTPUT_FORMATS[output_format]
+    return source_suffix if source_suffix in kept else new_suffix
+
+
+def encode_best(img, task, buffer):
+    """Encode img with every candidate format and leave the smallest in buffer.
+
+    Returns a dict with the chosen output_format, content profile and,
+    for searched qualities, quality and quality_metrics.
+    """
+    profile = classify(img)
+    quality_mode = task.get('quality_mode', 'fixed')
+    best = None
+    trial = io.BytesIO()
+    for output_format in candidate_formats(profile, task.get('allow_avif')):
+        candidate = prepare(img, output_format, profile['alpha'])
+        save_kwargs = save_kwargs_for(output_format, task['quality'], task.get('encoder'))
+        choice = {'output_format': output_format, 'content_profile': profile}
+        if quality_mode != 'fixed' and 'quality' in save_kwargs:
+            quality, metrics = search_quality(
+                candidate, save_kwargs, quality_mode, trial,
+                target_size=task.get('target_size'),
+                min_ssim=task.get('min_ssim'),
+                min_psnr=task.get('min_psnr')
+            )
+            choice.update(quality=quality, quality_metrics=metrics)
+        else:
+            trial.seek(0)
+            trial.truncate()
+            candidate.save(trial, **save_kwargs)
+        if best is None or trial.tell() < best[1].tell():
+            best = (choice, trial)
+            trial = io.BytesIO()
+    with best[1].getbuffer() as view:
+        buffer.write(view)
+    return best[0]
@@ -0,0 +1,115 @@
+"""Append-only job journal for resuming interrupted runs.
+
+The first line describes the job (directory and settings). After that,
+completed paths are appended in batches, one JSON line per batch, and
+the file is fsynced at most every ``FSYNC_INTERVAL`` seconds. A run that
+finishes appends a "complete" line. Resuming reads the journal back,
+drops a torn last line left by a crash, and skips every path already
+recorded; at most the last unsynced batch is redone.
+"""
+import json
+import os
+import time
+
+DEFAULT_JOURNAL_NAME = '.imgcompress-journal.jsonl'
+BATCH_SIZE = 64  # Paths per journal line
+FSYNC_INTERVAL = 2.0  # Seconds
+
+
+def default_journal_path(directory):
+    return os.path.join(directory, DEFAULT_JOURNAL_NAME)
+
+
+class JobJournal:
+    """Record completed paths of one job; with resume=True, continue an earlier one.
+
+    Paths are stored relative to ``root``. ``completed`` holds the paths
+    recorded by the run being resumed.
+    """
+
+    def __init__(self, path, root, settings, resume=False):
+        self.path = path
+        self.root = root
+        self.settings = settings
+        self.completed = set()
+        self.pending = []
+        self.last_sync = time.monotonic()
+        self.resumed = resume and self._load()
+        if self.resumed:
+            self.file = open(path, 'a', encoding='utf-8')
+        else:
+            self.completed = set()
+            self.file = open(path, 'w', encoding='utf-8')
+            self._write({'type': 'job', 'directory': os.path.abspath(root),
+                         'settings': settings, 'started': time.time()}, sync=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _load(self):
+        """Read an earlier journal for this job; False if there is none to resume"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        valid_end = 0
+        header = None
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn write from a crash; everything after it is lost
+                if not line.endswith(b'\n'):
+                    break
+                valid_end += len(line)
+                if header is None:
+                    header = record
+                elif record.get('type') == 'done':
+                    self.completed.update(record['paths'])
+                elif record.get('type') == 'complete':
+                    return False  # That job finished; start a new one
+        if (header is None or header.get('type') != 'job' or header.get('settings') != self.settings
+                or header.get('directory') != os.path.abspath(self.root)):
+            return False
+        os.truncate(self.path, valid_end)
+        return True
+
+    def _write(self, record, sync=False):
+        self.file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self.file.flush()
+        now = time.monotonic()
+        if sync or now - self.last_sync >= FSYNC_INTERVAL:
+            os.fsync(self.file.fileno())
+            self.last_sync = now
+
+    def is_done(self, path):
+        return os.path.relpath(path, self.root) in self.completed
+
+    def record(self, *paths):
+        """Mark paths as finished; written out once a batch is full"""
+        for path in paths:
+            self.pending.append(os.path.relpath(path, self.root))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self, sync=False):
+        if self.pending:
+            self._write({'type': 'done', 'paths': self.pending}, sync)
+            self.pending = []
+        elif sync:
+            os.fsync(self.file.fileno())
+
+    def complete(self):
+        """Mark the job finished so a later resume starts afresh"""
+        self.flush()
+        self._write({'type': 'complete', 'finished': time.time()}, sync=True)
+
+    def close(self):
+        if self.file is not None:
+            self.flush(sync=True)
+            self.file.close()
+            self.file = None
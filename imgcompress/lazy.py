@@ -0,0 +1,22 @@
+"""Deferred imports of heavy optional dependencies.
+
+NumPy alone takes longer to import than the rest of the package, and
+only the quality search, near-duplicate hashing and palette reduction
+need it, so it is imported on first use instead of at startup.
+"""
+import importlib
+
+_MISSING = object()
+_modules = {}
+
+
+def optional_import(name):
+    """The module called name, imported on first use; None if it is not installed"""
+    module = _modules.get(name, _MISSING)
+    if module is _MISSING:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            module = None
+        _modules[name] = module
+    return module
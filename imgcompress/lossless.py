@@ -0,0 +1,207 @@
+"""Lossless JPEG and PNG optimization.
+
+JPEGs are never decoded. Metadata segments are dropped by walking the
+marker structure in Python, and, when ``jpegtran`` is on PATH, its
+Huffman-table optimization rewrites the entropy-coded data without
+touching the DCT coefficients. PNGs are decoded (PNG is lossless anyway),
+reduced to an exact palette when they have at most 256 colours, and
+encoded with each zlib strategy in turn, keeping the smallest. PNGs with
+16 bits per sample are left alone: Pillow decodes them to 8 bits.
+"""
+import io
+import shutil
+import subprocess
+import zlib
+
+from PIL import Image, ImageChops
+
+from .lazy import optional_import  # NumPy is only needed for palette reduction
+
+LOSSLESS_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Pillow chooses PNG row filters itself (adaptive per row, none for
+# palettes); what it does expose is the zlib strategy. HUFFMAN_ONLY and
+# FIXED almost never win, so they are not worth the extra encodes.
+PNG_STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE)
+
+ORIENTATION_TAG = 0x0112
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+ICC_SIGNATURE = b'ICC_PROFILE\x00'
+JPEGTRAN_TIMEOUT = 120  # Seconds per file
+
+_SOI = b'\xff\xd8'
+_APP0 = 0xE0
+_APP1 = 0xE1
+_APP2 = 0xE2
+_APP14 = 0xEE  # Adobe: tells decoders how to interpret CMYK/YCCK, keep it
+_COM = 0xFE
+_SOS = 0xDA
+_EOI = 0xD9
+_STANDALONE = {0x01} | set(range(0xD0, 0xD8))
+
+
+def find_jpegtran():
+    """Path of the jpegtran binary, or None"""
+    return shutil.which('jpegtran')
+
+
+def _segment(marker, payload):
+    return bytes((0xFF, marker)) + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+
+def _split_jpeg(data):
+    """Split JPEG bytes into ([(marker, segment bytes)], tail from SOS on)"""
+    if data[:2] != _SOI:
+        raise ValueError("Not a JPEG file")
+    segments = []
+    pos = 2
+    while pos < len(data) - 1:
+        if data[pos] != 0xFF:
+            raise ValueError("Corrupt JPEG marker structure")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # Fill byte
+            pos += 1
+            continue
+        if marker in (_SOS, _EOI):
+            return segments, data[pos:]
+        if marker in _STANDALONE:
+            segments.append((marker, data[pos:pos + 2]))
+            pos += 2
+            continue
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if end > len(data):
+            raise ValueError("Truncated JPEG segment")
+        segments.append((marker, data[pos:end]))
+        pos = end
+    raise ValueError("JPEG has no image data")
+
+
+def is_srgb_profile(profile):
+    """True if an ICC profile's description names sRGB"""
+    return b'sRGB' in profile or 'sRGB'.encode('utf-16-be') in profile
+
+
+def strip_jpeg_metadata(data, orientation=1):
+    """Return data without EXIF, XMP, thumbnails, comments or sRGB ICC profiles.
+
+    A non-sRGB ICC profile is kept because dropping it would change the
+    displayed colours. If orientation is not 1, a minimal EXIF block with
+    only the orientation tag replaces the original so the image still
+    displays upright.
+    """
+    segments, tail = _split_jpeg(data)
+    icc = b''.join(seg[4 + len(ICC_SIGNATURE) + 2:] for marker, seg in segments
+                   if marker == _APP2 and seg[4:4 + len(ICC_SIGNATURE)] == ICC_SIGNATURE)
+    keep_icc = bool(icc) and not is_srgb_profile(icc)
+
+    kept = [_SOI]
+    exif_written = orientation == 1
+    for marker, seg in segments:
+        if not exif_written and marker != _APP0:
+            exif = Image.Exif()
+            exif[ORIENTATION_TAG] = orientation
+            kept.append(_segment(_APP1, exif.tobytes()))
+            exif_written = True
+        is_icc = marker == _APP2 and seg[4:4 + len(ICC_SIGNATURE)] == ICC_SIGNATURE
+        if marker == _COM or (_APP1 <= marker <= 0xEF and marker != _APP14 and not (is_icc and keep_icc)):
+            continue
+        kept.append(seg)
+    kept.append(tail)
+    return b''.join(kept)
+
+
+def jpegtran_optimize(data, jpegtran):
+    """Losslessly re-optimize Huffman tables (progressive) with jpegtran"""
+    completed = subprocess.run(
+        [jpegtran, '-copy', 'all', '-optimize', '-progressive'],
+        input=data, capture_output=True, timeout=JPEGTRAN_TIMEOUT, check=True
+    )
+    return completed.stdout
+
+
+def optimize_jpeg(path, buffer, jpegtran=None):
+    """Write a losslessly optimized copy of the JPEG at path into buffer.
+
+    Returns False, leaving buffer empty, for multi-picture (MPO) files:
+    their MP index holds byte offsets of the images appended after the
+    first one, so neither stripping segments nor jpegtran may touch them.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format == 'MPO':
+            return False
+        if img.format != 'JPEG':
+            raise ValueError(f"{img.format} file with a JPEG extension")
+        orientation = img.getexif().get(ORIENTATION_TAG, 1)  # Header only, no decode
+    data = strip_jpeg_metadata(data, orientation)
+    if jpegtran:
+        data = jpegtran_optimize(data, jpegtran)
+    buffer.write(data)
+    return True
+
+
+def png_bit_depth(path):
+    """Bits per sample from the PNG's IHDR chunk"""
+    with open(path, 'rb') as f:
+        header = f.read(25)
+    if len(header) < 25 or header[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    return header[24]
+
+
+def exact_palette(img):
+    """img as a 'P' image with identical pixels, or None if not possible"""
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA') or 'transparency' in img.info:
+        return None
+    mode = 'RGBA' if img.mode in ('RGBA', 'LA') else 'RGB'
+    source = img.convert(mode) if img.mode != mode else img
+    if source.getcolors(256) is None:
+        return None
+    np = optional_import('numpy')
+    if np is None:
+        return None
+    # quantize() onto a fixed palette is not exact (it can merge close
+    # colours), so index the packed RGBA values directly
+    rgba = source if mode == 'RGBA' else source.convert('RGBA')
+    packed = np.ascontiguousarray(np.asarray(rgba)).view(np.uint32)[..., 0]
+    palette, indices = np.unique(packed, return_inverse=True)
+    reduced = Image.fromarray(indices.reshape(packed.shape).astype(np.uint8), 'P')
+    entries = palette.view(np.uint8).reshape(-1, 4)
+    if mode == 'RGBA':
+        reduced.putpalette(entries.tobytes(), 'RGBA')
+    else:
+        reduced.putpalette(entries[:, :3].tobytes())
+    extrema = ImageChops.difference(reduced.convert(mode), source).getextrema()
+    if any(high for _, high in extrema):
+        return None  # Never expected; a palette that is not exact would be lossy
+    return reduced
+
+
+def optimize_png(img, buffer):
+    """Encode img into buffer as the smallest of the lossless PNG candidates.
+
+    Returns whether a palette reduction was applied.
+    """
+    candidates = [img]
+    reduced = exact_palette(img)
+    if reduced is not None:
+        candidates.append(reduced)
+
+    save_kwargs = {'format': 'PNG', 'optimize': True}
+    if img.info.get('icc_profile'):
+        save_kwargs['icc_profile'] = img.info['icc_profile']
+
+    best = None
+    best_reduced = False
+    trial = io.BytesIO()
+    for candidate in candidates:
+        for strategy in PNG_STRATEGIES:
+            trial.seek(0)
+            trial.truncate()
+            candidate.save(trial, compress_type=strategy, **save_kwargs)
+            if best is None or trial.tell() < len(best):
+                best = trial.getvalue()
+                best_reduced = candidate is reduced
+    buffer.write(best)
+    return best_reduced
@@ -0,0 +1,137 @@
+"""Persistent record of already-compressed files for incremental runs.
+
+Each row stores the size, mtime and content hash a file had right after
+it was compressed, plus the settings it was compressed with. A later run
+skips any file whose size and mtime still match with one primary-key
+lookup, and only rehashes files whose mtime changed but size did not.
+Files that were only copied or linked into a mirror are recorded without
+a hash; they are compared against their mirrored copy when needed.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_MANIFEST_NAME = '.imgcompress-manifest.sqlite'
+HASH_CHUNK_SIZE = 1024 * 1024
+COMMIT_INTERVAL = 500  # Records per transaction
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """Return a hex digest of the file contents, read in streaming chunks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_key(settings):
+    """Stable string form of a settings dict for equality checks"""
+    return json.dumps(settings, sort_keys=True, separators=(',', ':'))
+
+
+class Manifest:
+    """SQLite-backed map of path -> state after the last compression.
+
+    Paths are stored relative to ``root`` so a tree can be moved or
+    mounted elsewhere without invalidating the manifest. A connection is
+    bound to the thread that opened it, so the engine only touches the
+    manifest from its coordinating thread.
+    """
+
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " settings TEXT NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def key(self, path):
+        return os.path.relpath(path, self.root)
+
+    def lookup(self, path):
+        """Return (size, mtime_ns, content_hash, settings) or None"""
+        return self.conn.execute(
+            "SELECT size, mtime_ns, content_hash, settings FROM files WHERE path = ?",
+            (self.key(path),)
+        ).fetchone()
+
+    def is_current(self, path, size, mtime_ns, settings, copy_path=None):
+        """True if the file is unchanged since it was compressed with settings.
+        
+        copy_path is where an unhashed (copied or linked) file was mirrored to.
+        """
+        row = self.lookup(path)
+        if row is None:
+            return False
+        rec_size, rec_mtime_ns, rec_hash, rec_settings = row
+        if rec_settings != settings or rec_size != size:
+            return False
+        if rec_mtime_ns == mtime_ns:
+            return True
+
+        # Same size but touched (copied, restored from backup...): only the
+        # content hash can tell whether it really changed
+        try:
+            content_hash = hash_file(path)
+            if rec_hash:
+                if content_hash != rec_hash:
+                    return False
+            elif copy_path is None or hash_file(copy_path) != content_hash:
+                return False
+        except OSError:
+            return False
+        self.conn.execute("UPDATE files SET mtime_ns = ?, content_hash = ? WHERE path = ?",
+                          (mtime_ns, content_hash, self.key(path)))
+        self._maybe_commit()
+        return True
+
+    def record(self, path, size, mtime_ns, content_hash, settings):
+        """Remember the post-compression state of path"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash, settings, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self.key(path), size, mtime_ns, content_hash, settings, time.time())
+        )
+        self._maybe_commit()
+
+    def _maybe_commit(self):
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+            self.conn = None
+
+
+def default_manifest_path(directory):
+    return os.path.join(directory, DEFAULT_MANIFEST_NAME)
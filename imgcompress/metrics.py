@@ -0,0 +1,201 @@
+"""Per-file stage timings, metrics streams and profiling helpers.
+
+Workers time each stage of ``compress_single_image`` (open, decode,
+convert, encode, write, fsync, hash) with a ``StageTimer``. The engine
+streams one row per file to a JSON-lines or CSV file and keeps a bounded
+sample per format and stage for p50/p95/p99 summaries.
+"""
+import csv
+import cProfile
+import json
+import math
+import pstats
+import random
+import time
+
+STAGES = ('open', 'decode', 'convert', 'encode', 'write', 'fsync', 'hash')
+PERCENTILES = (50, 95, 99)
+MAX_SAMPLES = 100000  # Per format and stage; reservoir-sampled beyond this
+
+
+class StageTimer:
+    """Accumulate wall time per named stage between successive marks"""
+
+    def __init__(self):
+        self.timings = {}
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self.last)
+        self.last = now
+
+
+class _Reservoir:
+    def __init__(self, rng, capacity=MAX_SAMPLES):
+        self.rng = rng
+        self.capacity = capacity
+        self.samples = []
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if len(self.samples) < self.capacity:
+            self.samples.append(value)
+        else:
+            index = self.rng.randrange(self.count)
+            if index < self.capacity:
+                self.samples[index] = value
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, rank - 1)]
+
+
+def summarize(reservoir):
+    values = sorted(reservoir.samples)
+    stats = {
+        'count': reservoir.count,
+        'mean': sum(values) / len(values) if values else 0.0
+    }
+    for pct in PERCENTILES:
+        stats[f'p{pct}'] = percentile(values, pct)
+    return stats
+
+
+class MetricsRecorder:
+    """Write per-file metrics rows and summarize them per format.
+
+    The output format follows the file extension: ``.csv`` writes CSV,
+    anything else JSON lines. path=None only keeps the summary.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None
+        self.writer = None
+        self.rng = random.Random(0)
+        self.samples = {}  # (format, stage) -> _Reservoir
+        self.peaks = {}  # format -> _Reservoir of traced peak bytes
+        if path:
+            self.file = open(path, 'w', encoding='utf-8', newline='')
+            if path.lower().endswith('.csv'):
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(['path', 'format', 'action', 'success', 'original_size',
+                                      'new_size', 'total'] + list(STAGES) + ['traced_peak'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def record(self, result):
+        timings = result.get('timings')
+        if timings is None:
+            return
+        fmt = result.get('format') or 'unknown'
+        total = sum(timings.get(stage, 0.0) for stage in STAGES)
+        for stage, value in list(timings.items()) + [('total', total)]:
+            key = (fmt, stage)
+            if key not in self.samples:
+                self.samples[key] = _Reservoir(self.rng)
+            self.samples[key].add(value)
+        traced_peak = result.get('traced_peak')
+        if traced_peak is not None:
+            if fmt not in self.peaks:
+                self.peaks[fmt] = _Reservoir(self.rng)
+            self.peaks[fmt].add(traced_peak)
+
+        if self.writer is not None:
+            self.writer.writerow(
+                [result['path'], fmt, result.get('action'), result['success'],
+                 result['original_size'], result['new_size'], f"{total:.6f}"]
+                + [f"{timings[stage]:.6f}" if stage in timings else '' for stage in STAGES]
+                + [traced_peak if traced_peak is not None else '']
+            )
+        elif self.file is not None:
+            row = {
+                'path': result['path'],
+                'format': fmt,
+                'action': result.get('action'),
+                'success': result['success'],
+                'original_size': result['original_size'],
+                'new_size': result['new_size'],
+                'total': total,
+                'timings': timings
+            }
+            if traced_peak is not None:
+                row['traced_peak'] = traced_peak
+            self.file.write(json.dumps(row) + "\n")
+
+    def summary(self):
+        """{format: {stage: {count, mean, p50, p95, p99}}}"""
+        summary = {}
+        for (fmt, stage), reservoir in sorted(self.samples.items()):
+            summary.setdefault(fmt, {})[stage] = summarize(reservoir)
+        return summary
+
+    def peak_summary(self):
+        """{format: {count, mean, p50, p95, p99}} of traced peak bytes"""
+        return {fmt: summarize(reservoir) for fmt, reservoir in sorted(self.peaks.items())}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class _RawStats:
+    """Adapter so pstats can load the stats dict a worker sent back"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profile_call(func, *args):
+    """Run func under cProfile and return (value, raw stats dict or None).
+
+    Python 3.12+ allows only one active profiler per process, so when
+    another thread is already profiling the call simply runs unprofiled.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return func(*args), None
+    try:
+        value = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return value, profiler.stats
+
+
+class ProfileCollector:
+    """Merge raw cProfile stats from workers into one pstats file"""
+
+    def __init__(self):
+        self.stats = None
+
+    def add(self, raw_stats):
+        if not raw_stats:
+            return
+        if self.stats is None:
+            self.stats = pstats.Stats(_RawStats(raw_stats))
+        else:
+            self.stats.add(_RawStats(raw_stats))
+
+    def dump(self, path):
+        """Write merged stats (readable with python -m pstats); False if empty"""
+        if self.stats is None:
+            return False
+        self.stats.dump_stats(path)
+        return True
@@ -0,0 +1,92 @@
+"""Copy or hard-link files into a mirrored output tree.
+
+Files that are not compressed still have to appear in the mirror. They
+are hard-linked when allowed (no data is moved at all) and otherwise
+copied with ``os.copy_file_range`` or ``os.sendfile``, so the bytes stay
+in the kernel instead of passing through Python buffers.
+"""
+import os
+import shutil
+import tempfile
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def mirror_destination(path, source_root, output_root):
+    """Path under output_root that corresponds to path under source_root"""
+    return os.path.join(output_root, os.path.relpath(path, source_root))
+
+
+def _kernel_copy(src_fd, dst_fd, size):
+    """Copy size bytes between file descriptors without userspace buffers.
+
+    Returns False if neither copy_file_range nor sendfile is usable, in
+    which case nothing has been written.
+    """
+    for name in ('copy_file_range', 'sendfile'):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if name == 'copy_file_range':
+                    sent = func(src_fd, dst_fd, min(COPY_CHUNK_SIZE, size - offset), offset_src=offset)
+                else:
+                    sent = func(dst_fd, src_fd, offset, min(COPY_CHUNK_SIZE, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+            return True
+        except OSError:
+            if offset:
+                raise  # Partial copy: don't silently switch mechanisms
+            continue  # Unsupported for this filesystem pair, try the next one
+    return False
+
+
+def copy_file(src, dst):
+    """Copy src to dst atomically, preserving permission bits and times"""
+    directory, name = os.path.split(dst)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+    try:
+        with open(src, 'rb') as fsrc, os.fdopen(fd, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            if not _kernel_copy(fsrc.fileno(), fdst.fileno(), size):
+                shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def mirror_file(src, dst, link=False):
+    """Place src at dst by hard link (if link and possible) or copy.
+
+    Returns "linked" or "copied".
+    """
+    if link:
+        directory, name = os.path.split(dst)
+        os.makedirs(directory, exist_ok=True)
+        # Link under a temporary name and rename over dst, so an existing
+        # dst is never missing even for a moment
+        tmp_path = os.path.join(directory, f'.{name}.{os.getpid()}.link')
+        try:
+            os.link(src, tmp_path)
+            os.replace(tmp_path, dst)
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)  # dst already was this inode; rename did nothing
+            return 'linked'
+        except OSError:
+            # Cross-device, unsupported filesystem or no permission
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    copy_file(src, dst)
+    return 'copied'
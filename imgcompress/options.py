@@ -0,0 +1,20 @@
+"""Choices and defaults the command-line parsers need.
+
+They live apart from the modules that implement them, which import
+Pillow, so ``imgcompress --help`` and ``imgcompress worker`` can build
+their parsers without loading it.
+"""
+
+QUALITY_MODES = ('fixed', 'target-size', 'ssim', 'psnr')
+FORMAT_POLICIES = ('keep', 'auto')
+ANIMATION_TARGETS = ('webp', 'gif')
+DEDUP_MODES = ('copy', 'link')
+DEFAULT_NEAR_DISTANCE = 6  # Max differing dhash bits; must stay below DHASH_BANDS
+
+# Calibration
+DEFAULT_SAMPLES = 20
+DEFAULT_MAX_GROWTH = 2.0  # Percent of output size traded for speed
+
+# Distributed mode
+DEFAULT_LEASE_TTL = 60.0  # Seconds without a renewal before a lease is reassigned
+TOKEN_ENV = 'IMGCOMPRESS_TOKEN'
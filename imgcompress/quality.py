@@ -0,0 +1,152 @@
+"""Per-image quality selection for lossy encoders.
+
+Instead of one global quality, bisect the encoder quality for each image
+until the output either fits a target byte size or stays above a
+perceptual floor (SSIM or PSNR on a downsampled luma plane). The source
+image is decoded once; candidates are encoded into one in-memory buffer
+that ends up holding the chosen encoding.
+"""
+import io
+
+from PIL import Image
+
+from .lazy import optional_import  # Only the perceptual modes need NumPy
+from .options import QUALITY_MODES
+
+MIN_QUALITY = 30
+MAX_QUALITY = 95
+LUMA_MAX_SIDE = 512  # Metrics are computed on a plane at most this big
+SSIM_WINDOW = 7
+
+
+def encode(img, save_kwargs, quality, buffer=None):
+    """Encode img at quality into buffer (a BytesIO) and return its size"""
+    if buffer is None:
+        buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    img.save(buffer, **dict(save_kwargs, quality=quality))
+    return buffer.tell()
+
+
+def luma_plane(img, factor):
+    """Box-downsampled luma as a float64 array"""
+    np = optional_import('numpy')
+    if factor > 1:
+        img = img.reduce(factor)
+    return np.asarray(img.convert('L'), dtype=np.float64)
+
+
+def _box_mean(x, win):
+    # Mean over every win x win window using a summed-area table
+    np = optional_import('numpy')
+    c = np.pad(x.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    s = c[win:, win:] - c[:-win, win:] - c[win:, :-win] + c[:-win, :-win]
+    return s / (win * win)
+
+
+def ssim(a, b, win=SSIM_WINDOW):
+    """Mean structural similarity of two equally sized luma planes"""
+    win = max(1, min(win, a.shape[0], a.shape[1]))
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    mu_a = _box_mean(a, win)
+    mu_b = _box_mean(b, win)
+    var_a = _box_mean(a * a, win) - mu_a * mu_a
+    var_b = _box_mean(b * b, win) - mu_b * mu_b
+    cov = _box_mean(a * b, win) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / (
+        (mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio in dB (inf for identical planes)"""
+    np = optional_import('numpy')
+    mse = float(np.mean((a - b) ** 2))
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(255 * 255 / mse)
+
+
+def _bisect(lo, hi, acceptable):
+    """Return the boundary quality for a monotone predicate.
+
+    acceptable(q) -> (ok, prefer_higher). Returns the best q seen that is
+    ok, or None if none was.
+    """
+    best = None
+    while lo <= hi:
+        q = (lo + hi) // 2
+        ok, prefer_higher = acceptable(q)
+        if ok:
+            best = q
+        if prefer_higher:
+            lo = q + 1
+        else:
+            hi = q - 1
+    return best
+
+
+def search_quality(img, save_kwargs, mode, buffer=None, target_size=None, min_ssim=None,
+                   min_psnr=None, min_quality=MIN_QUALITY, max_quality=MAX_QUALITY):
+    """Pick a quality for img and return (quality, metrics).
+
+    target-size: highest quality whose output is at most target_size bytes.
+    ssim / psnr: lowest quality whose output stays at or above the floor.
+    If no quality satisfies the goal the closest end of the range is used.
+    On return buffer holds the encoding at the chosen quality, with the
+    stream position at its end.
+    """
+    if buffer is None:
+        buffer = io.BytesIO()
+    sizes = {}
+    metrics = {}
+    state = {'encoded': None}  # Quality currently held in buffer
+
+    def size_at(q):
+        if q not in sizes:
+            sizes[q] = encode(img, save_kwargs, q, buffer)
+            state['encoded'] = q
+        return sizes[q]
+
+    if mode == 'target-size':
+        if not target_size:
+            raise ValueError("target-size mode needs a target_size")
+        best = _bisect(min_quality, max_quality,
+                       lambda q: (size_at(q) <= target_size, size_at(q) <= target_size))
+        quality = min_quality if best is None else best
+    elif mode in ('ssim', 'psnr'):
+        if optional_import('numpy') is None:
+            raise RuntimeError(f"{mode} quality mode requires NumPy (pip install numpy)")
+        floor = min_ssim if mode == 'ssim' else min_psnr
+        if floor is None:
+            raise ValueError(f"{mode} mode needs a min_{mode}")
+        metric = ssim if mode == 'ssim' else psnr
+        factor = max(1, max(img.size) // LUMA_MAX_SIDE)
+        reference = luma_plane(img, factor)
+
+        def score_at(q):
+            if q not in metrics:
+                size_at(q)
+                if state['encoded'] != q:
+                    encode(img, save_kwargs, q, buffer)
+                    state['encoded'] = q
+                buffer.seek(0)
+                with Image.open(buffer) as candidate:
+                    metrics[q] = metric(reference, luma_plane(candidate, factor))
+            return metrics[q]
+
+        best = _bisect(min_quality, max_quality,
+                       lambda q: (score_at(q) >= floor, score_at(q) < floor))
+        quality = max_quality if best is None else best
+    else:
+        raise ValueError(f"Unknown quality mode {mode!r}, expected one of {QUALITY_MODES}")
+
+    if state['encoded'] != quality:
+        encode(img, save_kwargs, quality, buffer)
+    buffer.seek(0, io.SEEK_END)
+    result_metrics = {'candidates': len(sizes)}
+    if quality in metrics:
+        result_metrics[mode] = metrics[quality]
+    return quality, result_metrics
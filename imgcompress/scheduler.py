@@ -0,0 +1,101 @@
+"""Admission control that bounds the memory used by concurrent decodes.
+
+The worker count alone does not bound memory: a few 100-megapixel TIFFs
+decoded at once can exhaust a host while small images wait behind them.
+Each task gets a cost estimated from its image header (no pixel data is
+read) and is only started once the sum of running costs fits a global
+budget. Smaller tasks from a lookahead window are packed around large
+ones, and a task that is bigger than the whole budget runs on its own.
+"""
+from collections import deque
+
+from PIL import Image
+
+DECODE_OVERHEAD = 2  # Decoded buffer plus conversion/resize/encoder copies
+DEFAULT_LOOKAHEAD = 256  # Scanned tasks considered for packing
+MAX_BYPASS = 32  # Smaller tasks allowed to overtake a blocked one
+
+
+def estimate_decode_bytes(path, max_dimension=None, fallback=0):
+    """Estimate peak bytes needed to process an image from its header only"""
+    try:
+        with Image.open(path) as img:  # Lazy: reads the header, not the pixels
+            width, height = img.size
+            bands = max(3, len(img.getbands()))  # Palette images expand on convert
+            if max_dimension and img.format == 'JPEG':
+                # Draft mode decodes at 1/2, 1/4 or 1/8 scale
+                scale = 1
+                while scale < 8 and max(width, height) / (scale * 2) >= max_dimension:
+                    scale *= 2
+                width, height = width // scale, height // scale
+    except Exception:
+        return fallback
+    return width * height * bands * DECODE_OVERHEAD
+
+
+class MemoryScheduler:
+    """Pick which pending tasks may start without exceeding a byte budget.
+
+    Not thread-safe: the engine drives it from its coordinating thread.
+    A budget of None admits everything in submission order.
+    """
+
+    def __init__(self, budget=None, lookahead=DEFAULT_LOOKAHEAD, max_bypass=MAX_BYPASS):
+        self.budget = budget
+        self.lookahead = lookahead
+        self.max_bypass = max_bypass
+        self.pending = deque()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.head_bypassed = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def wants_more(self):
+        return len(self.pending) < self.lookahead
+
+    def add(self, task, cost=0):
+        self.pending.append((self.clamp(cost), task))
+
+    def clamp(self, cost):
+        # Anything larger than the budget runs alone rather than never
+        if self.budget is None:
+            return 0
+        return min(cost, self.budget)
+
+    def pop_admissible(self, allowance=0):
+        """Return (cost, task) for the next task that fits, or None.
+
+        allowance is what the caller already reserved for earlier tasks of
+        the same chunk. They run one after another, so only the part of a
+        task's cost above the allowance is reserved.
+        """
+        if not self.pending:
+            return None
+        if self.budget is None:
+            return self.pending.popleft()
+
+        available = self.budget - self.in_use + allowance
+        head_cost = self.pending[0][0]
+        if head_cost <= available:
+            self.head_bypassed = 0
+            return self._admit(0, allowance)
+        if self.head_bypassed >= self.max_bypass:
+            return None  # Let running work drain so the head can start
+
+        for index in range(1, len(self.pending)):
+            if self.pending[index][0] <= available:
+                self.head_bypassed += 1
+                return self._admit(index, allowance)
+        return None
+
+    def _admit(self, index, allowance=0):
+        item = self.pending[index]
+        del self.pending[index]
+        self.in_use += max(0, item[0] - allowance)
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return item
+
+    def release(self, cost):
+        self.in_use -= cost
@@ -0,0 +1,148 @@
+"""Coordinator/worker tests: leases, renewal, expiry and cancellation.
+
+Run from the repository root with ``python -m pytest tests``. Most tests
+start real worker processes with ``start_local_workers``; the renewal and
+expiry tests speak the protocol directly so their timing is deterministic.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import wait
+
+from PIL import Image
+
+from imgcompress.cli import start_local_workers, stop_local_workers
+from imgcompress.distributed import Coordinator, _Connection
+from imgcompress.engine import CompressionEngine, compress_batch
+from imgcompress.scanner import scan_directory
+
+TOKEN = 'test-token'
+
+
+def make_tree(directory, count):
+    for i in range(count):
+        Image.new('RGB', (64, 64), (i * 20 % 256, 90, 160)).save(os.path.join(directory, f'img{i}.png'))
+
+
+class CoordinatorTestCase(unittest.TestCase):
+    lease_ttl = 30.0
+    token = TOKEN
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        make_tree(self.directory, 6)
+        self.coordinator = Coordinator('127.0.0.1', 0, self.lease_ttl, self.token).start()
+        self.cancel_event = threading.Event()
+        self.coordinator.cancel_event = self.cancel_event
+        self.workers = []
+
+    def tearDown(self):
+        self.cancel_event.set()
+        self.coordinator.shutdown(wait=False, cancel_futures=True)
+        stop_local_workers(self.workers)
+        shutil.rmtree(self.directory)
+
+    def submit_tree(self, chunk_size=2):
+        engine = CompressionEngine(self.directory)
+        tasks = [engine.make_task(entry) for entry in scan_directory(self.directory, 0)]
+        return [self.coordinator.submit(compress_batch, tasks[i:i + chunk_size])
+                for i in range(0, len(tasks), chunk_size)]
+
+    def connect(self, token=TOKEN):
+        conn = _Connection(self.coordinator.address, token)
+        self.addCleanup(conn.close)
+        return conn
+
+
+class LeaseTest(CoordinatorTestCase):
+    def test_local_workers_process_every_lease(self):
+        futures = self.submit_tree()
+        self.workers = start_local_workers(3, self.coordinator.address, TOKEN)
+        done, not_done = wait(futures, timeout=60)
+        self.assertFalse(not_done)
+        results = [result for future in futures for result in future.result()]
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(self.coordinator.reassigned, 0)
+
+    def test_lease_is_granted_once(self):
+        self.submit_tree(chunk_size=6)
+        first = self.connect().request({'op': 'lease', 'worker': 'a'})
+        self.assertEqual(len(first['tasks']), 6)
+        self.assertEqual(first['ttl'], self.lease_ttl)
+        self.assertIn('wait', self.connect().request({'op': 'lease', 'worker': 'b'}))
+
+    def test_wrong_token_is_rejected(self):
+        with self.assertRaisesRegex(RuntimeError, "Invalid token"):
+            self.connect('wrong').request({'op': 'lease', 'worker': 'a'})
+
+
+class ExpiryTest(CoordinatorTestCase):
+    lease_ttl = 0.6
+
+    def test_renewed_lease_is_kept(self):
+        futures = self.submit_tree(chunk_size=6)
+        conn = self.connect()
+        lease = conn.request({'op': 'lease', 'worker': 'a'})
+        for _ in range(6):
+            time.sleep(0.2)
+            self.assertEqual(conn.request({'op': 'renew', 'lease': lease['lease'], 'worker': 'a'}),
+                             {'ok': True, 'cancel': False})
+        self.assertIn('wait', self.connect().request({'op': 'lease', 'worker': 'b'}))
+        results = compress_batch(lease['tasks'])
+        self.assertTrue(conn.request({'op': 'complete', 'lease': lease['lease'], 'worker': 'a',
+                                      'results': results})['ok'])
+        self.assertEqual(len(futures[0].result(timeout=5)), 6)
+        self.assertEqual(self.coordinator.reassigned, 0)
+
+    def test_silent_lease_is_reassigned(self):
+        futures = self.submit_tree(chunk_size=6)
+        silent = self.connect()
+        lease = silent.request({'op': 'lease', 'worker': 'silent'})
+        time.sleep(self.lease_ttl * 2)
+        self.assertFalse(silent.request({'op': 'renew', 'lease': lease['lease'], 'worker': 'silent'})['ok'])
+
+        self.workers = start_local_workers(2, self.coordinator.address, TOKEN)
+        results = futures[0].result(timeout=60)
+        self.assertEqual(self.coordinator.reassigned, 1)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result['success'] for result in results))
+        # The late report of the first holder is ignored
+        self.assertFalse(silent.request({'op': 'complete', 'lease': lease['lease'], 'worker': 'silent',
+                                         'results': []})['ok'])
+
+
+class CancelTest(CoordinatorTestCase):
+    def test_cancel_reaches_renewals(self):
+        self.submit_tree(chunk_size=6)
+        conn = self.connect()
+        lease = conn.request({'op': 'lease', 'worker': 'a'})
+        self.cancel_event.set()
+        self.assertTrue(conn.request({'op': 'renew', 'lease': lease['lease'], 'worker': 'a'})['cancel'])
+
+    def test_cancel_settles_queued_leases(self):
+        futures = self.submit_tree()
+        self.cancel_event.set()
+        self.workers = start_local_workers(2, self.coordinator.address, TOKEN)
+        self.coordinator.shutdown(wait=True)
+        results = [result for future in futures for result in future.result(timeout=5)]
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result['action'] == 'cancelled' for result in results))
+
+
+class TokenlessTest(CoordinatorTestCase):
+    token = None
+
+    def test_loopback_accepts_workers_without_token(self):
+        futures = self.submit_tree()
+        self.workers = start_local_workers(2, self.coordinator.address, None)
+        done, not_done = wait(futures, timeout=60)
+        self.assertFalse(not_done)
+        self.assertTrue(all(result['success'] for future in futures for result in future.result()))
+
+
+if __name__ == '__main__':
+    unittest.main()
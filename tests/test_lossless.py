@@ -0,0 +1,106 @@
+"""Lossless mode tests: files that must be kept as-is, EXIF orientation
+and the atomic write.
+
+Run from the repository root with ``python -m pytest tests``.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image, ImageChops
+
+from imgcompress.engine import CompressionEngine, compress_single_image
+from imgcompress.lossless import ORIENTATION_TAG, png_bit_depth
+from imgcompress.scanner import scan_directory
+
+
+def gradient(size=(160, 160)):
+    """A smooth RGB image: large when stored uncompressed, small once optimized"""
+    img = Image.linear_gradient('L').resize(size)
+    return Image.merge('RGB', (img, img.transpose(Image.Transpose.ROTATE_90), img))
+
+
+def noise(size=(160, 160)):
+    return Image.effect_noise(size, 64).convert('RGB')
+
+
+class LosslessTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def compress(self, name):
+        engine = CompressionEngine(self.directory, lossless=True)
+        entry = next(entry for entry in scan_directory(self.directory, 0) if entry.path == self.path(name))
+        return compress_single_image(engine.make_task(entry))
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def assert_kept(self, name):
+        before = self.read(name)
+        result = self.compress(name)
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['action'], 'kept')
+        self.assertEqual(self.read(name), before)
+        return result
+
+
+class KeptFileTest(LosslessTestCase):
+    def test_animated_png_is_kept(self):
+        frames = [noise(), gradient(), noise()]
+        frames[0].save(self.path('anim.png'), save_all=True, append_images=frames[1:], compress_level=0)
+        self.assert_kept('anim.png')
+        with Image.open(self.path('anim.png')) as img:
+            self.assertEqual(img.n_frames, 3)
+
+    def test_16_bit_png_is_kept(self):
+        Image.linear_gradient('L').convert('I;16').save(self.path('deep.png'), compress_level=0)
+        self.assertEqual(png_bit_depth(self.path('deep.png')), 16)
+        self.assert_kept('deep.png')
+
+    def test_mpo_with_jpeg_extension_is_kept(self):
+        noise().save(self.path('stereo.jpg'), format='MPO', save_all=True, append_images=[gradient()])
+        result = self.assert_kept('stereo.jpg')
+        self.assertEqual(result['format'], 'MPO')
+        with Image.open(self.path('stereo.jpg')) as img:
+            self.assertEqual(img.n_frames, 2)
+
+
+class OrientationTest(LosslessTestCase):
+    def test_orientation_survives_metadata_stripping(self):
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = 6
+        exif[0x010E] = 'description ' * 1000  # ImageDescription, dropped with the rest of EXIF
+        noise().save(self.path('rotated.jpg'), exif=exif, quality=95)
+        with Image.open(self.path('rotated.jpg')) as img:
+            pixels = img.copy()
+
+        result = self.compress('rotated.jpg')
+        self.assertEqual(result['action'], 'compressed')
+        with Image.open(self.path('rotated.jpg')) as img:
+            self.assertEqual(dict(img.getexif()), {ORIENTATION_TAG: 6})
+            self.assertIsNone(ImageChops.difference(img, pixels).getbbox())
+
+
+class AtomicWriteTest(LosslessTestCase):
+    def test_failed_replace_leaves_original_and_no_temp_file(self):
+        gradient().save(self.path('big.png'), compress_level=0)
+        before = self.read('big.png')
+        with mock.patch('imgcompress.engine.os.replace', side_effect=OSError("disk full")):
+            result = self.compress('big.png')
+        self.assertFalse(result['success'])
+        self.assertEqual(result['action'], 'failed')
+        self.assertIn("disk full", result['error'])
+        self.assertEqual(self.read('big.png'), before)
+        self.assertEqual(os.listdir(self.directory), ['big.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()